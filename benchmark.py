@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+# Plays a fixed, seeded number of battles and reports how fast they went.
+# Results are written to data/benchmarks as JSON, tagged with the current commit, so runs can be compared:
+#   python benchmark.py --player model --opponent heuristics --battles 200
+#   python benchmark.py --server localhost:8000 --opponent max
+# Only battles played without training are measured; training throughput isn't benchmarked here.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from poke_env.server_configuration import ServerConfiguration
+
+from src.geniusect.local_server.local_showdown_server import LocalShowdownServer, start_player
+from src.geniusect.showdown_pool import AUTHENTICATION_URL
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+BENCHMARK_DIR = os.path.join("data", "benchmarks")
+
+def _build_player_class(name : str):
+    if name == "random":
+        from poke_env.player.random_player import RandomPlayer
+        return RandomPlayer
+    elif name == "default":
+        from src.geniusect.player.default_player import DefaultPlayer
+        return DefaultPlayer
+    elif name == "max":
+        from src.geniusect.player.max_damage_player import MaxDamagePlayer
+        return MaxDamagePlayer
+    elif name == "heuristics":
+        from poke_env.player.baselines import SimpleHeuristicsPlayer
+        return SimpleHeuristicsPlayer
+    else:
+        raise AttributeError("Unknown player: " + name)
+
+def _build_player(name : str, server_configuration : ServerConfiguration, battle_format : str, concurrent_battles : int):
+    if name != "model":
+        return start_player(_build_player_class(name), server_configuration, battle_format=battle_format, max_concurrent_battles=concurrent_battles)
+
+    # The RLPlayer only holds the model; the battles are played by a ModelPlayer using it
+    from src.geniusect.player.model_player import ModelPlayer
+    from src.geniusect.player.reinforcement_learning_player import RLPlayer
+    rl_player = RLPlayer(train=False, validate=False, battle_format=battle_format, server_configuration=server_configuration, start_listening=False)
+    return start_player(ModelPlayer, server_configuration, rl_player=rl_player, battle_format=battle_format, max_concurrent_battles=concurrent_battles, inference_batcher=rl_player._inference_batcher)
+
+def _time_decisions(player) -> list:
+    """
+    Wraps the player so that every decision is timed, from the request to the order going out.
+    That includes waiting for the rest of the batch when the player batches its inference.
+    Returns the list that the latencies (in seconds) are appended to.
+    """
+    latencies = []
+    handle_battle_request = player._handle_battle_request
+
+    async def timed_handle_battle_request(*args, **kwargs):
+        start = time.perf_counter()
+        await handle_battle_request(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+
+    player._handle_battle_request = timed_handle_battle_request
+    return latencies
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == "darwin":
+        return peak_rss / (1024 * 1024)
+    return peak_rss / 1024
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(player_name : str, opponent_name : str, n_battles : int, server : str, seed : int, concurrent_battles : int, battle_format : str) -> dict:
+    random.seed(seed)
+    np.random.seed(seed)
+
+    local_server = None
+    if server == "simulator":
+        local_server = LocalShowdownServer(seed=seed)
+        server_configuration = local_server.server_configuration
+    else:
+        server_configuration = ServerConfiguration(server, AUTHENTICATION_URL)
+
+    player = _build_player(player_name, server_configuration, battle_format, concurrent_battles)
+    opponent = _build_player(opponent_name, server_configuration, battle_format, concurrent_battles)
+    latencies = _time_decisions(player)
+
+    loop = asyncio.get_event_loop()
+    start_time = time.perf_counter()
+    loop.run_until_complete(player.battle_against(opponent, n_battles=n_battles))
+    elapsed = time.perf_counter() - start_time
+
+    n_turns = sum(battle.turn for battle in player.battles.values())
+    # Players that let go of finished battles keep how many turns they took
+    n_turns += sum(summary.turns for summary in getattr(player, "battle_summaries", {}).values())
+    n_finished = player.n_finished_battles
+    results = {
+        "commit": _git_commit(),
+        "time": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "player": player_name,
+        "opponent": opponent_name,
+        "server": server,
+        "battle_format": battle_format,
+        "seed": seed,
+        "concurrent_battles": concurrent_battles,
+        "battles": n_finished,
+        "won": player.n_won_battles,
+        "turns": n_turns,
+        "decisions": len(latencies),
+        "seconds": elapsed,
+        "battles_per_second": n_finished / elapsed,
+        "turns_per_second": n_turns / elapsed,
+        "decision_latency_p50_ms": float(np.percentile(latencies, 50)) * 1000 if len(latencies) > 0 else None,
+        "decision_latency_p99_ms": float(np.percentile(latencies, 99)) * 1000 if len(latencies) > 0 else None,
+        "peak_rss_mb": _peak_rss_mb()
+    }
+
+    loop.run_until_complete(player.stop_listening())
+    loop.run_until_complete(opponent.stop_listening())
+    if local_server is not None:
+        local_server.close()
+
+    return results
+
+def write_results(results : dict, output_dir : str = BENCHMARK_DIR) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    commit = results["commit"][:10] if results["commit"] is not None else "unknown"
+    file_name = time.strftime("%Y%m%d-%H%M%S", time.localtime(results["time"])) + "-" + commit + "-" + results["player"] + "-vs-" + results["opponent"] + ".json"
+    path = os.path.join(output_dir, file_name)
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=4)
+    return path
+
+if __name__ == "__main__":
+    players = ["model", "random", "default", "max", "heuristics"]
+
+    parser = argparse.ArgumentParser(description="Measure battle throughput and decision latency")
+    parser.add_argument("--player", default="model", choices=players)
+    parser.add_argument("--opponent", default="heuristics", choices=players)
+    parser.add_argument("--battles", type=int, default=100)
+    parser.add_argument("--server", default="simulator", help="\"simulator\" for the in-process stand-in server, or the host:port of a Showdown server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrent", type=int, default=1, help="Battles each player plays at once")
+    parser.add_argument("--format", default="gen8randombattle")
+    parser.add_argument("--output", default=BENCHMARK_DIR)
+    args = parser.parse_args()
+
+    results = run_benchmark(args.player, args.opponent, args.battles, args.server, args.seed, args.concurrent, args.format)
+    path = write_results(results, args.output)
+
+    print("%d battles (%d turns) in %.2f seconds" % (results["battles"], results["turns"], results["seconds"]))
+    print("%.2f battles/sec, %.2f turns/sec" % (results["battles_per_second"], results["turns_per_second"]))
+    if results["decisions"] > 0:
+        print("Decision latency: p50 %.3f ms, p99 %.3f ms" % (results["decision_latency_p50_ms"], results["decision_latency_p99_ms"]))
+    if results["peak_rss_mb"] is not None:
+        print("Peak RSS: %.1f MB" % results["peak_rss_mb"])
+    print("Results written to " + path)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# Makes sure that importing the config stays cheap.
+# Baseline opponents, tools and benchmarks all import it, so it must not pull in
+# TensorFlow, matplotlib or keras-rl, and must import within the time budget.
+# Exits with a non-zero status if either check fails.
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["tensorflow", "matplotlib", "rl"]
+
+MEASURE_IMPORT = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import src.geniusect.config
+elapsed = time.perf_counter() - start
+
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+def measure_import(module_code : str = MEASURE_IMPORT):
+    # Every measurement runs in a fresh interpreter so nothing is already cached in sys.modules
+    output = subprocess.run([sys.executable, "-c", module_code], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time budget of src.geniusect.config")
+    parser.add_argument("--budget", type=float, default=0.5, help="Maximum median import time, in seconds")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    measurements = [measure_import() for _ in range(args.runs)]
+    median_seconds = statistics.median([measurement["seconds"] for measurement in measurements])
+
+    loaded_heavy_modules = sorted(set(
+        module for module in measurements[0]["modules"] if module.split(".")[0] in HEAVY_MODULES
+    ))
+
+    print("Median import time of src.geniusect.config: %.3f seconds (budget %.3f)" % (median_seconds, args.budget))
+
+    failed = False
+    if median_seconds > args.budget:
+        print("Import time is over budget")
+        failed = True
+
+    if len(loaded_heavy_modules) > 0:
+        print("Importing the config loaded heavy modules: " + ", ".join(loaded_heavy_modules))
+        failed = True
+
+    sys.exit(1 if failed else 0)
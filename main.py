@@ -1,40 +1,66 @@
 #!/usr/bin/env python3
 
 import logging
-import threading
-def start_showdown(**kwargs):    
-    try:
-        import subprocess
-        print("Starting local Showdown server")
-        subprocess.run(["node", "Pokemon-Showdown/pokemon-showdown"])
-    except FileNotFoundError:
-        pass
 
 import src.geniusect.config as config
 
+# Refresh the dex data before anything from poke_env loads it
+config.update_data()
+
 from poke_env.player_configuration import PlayerConfiguration
 from poke_env.server_configuration import ShowdownServerConfiguration
 
+from src.geniusect.local_server.local_showdown_server import LocalShowdownServer
 from src.geniusect.player.reinforcement_learning_player import RLPlayer
+from src.geniusect.showdown_pool import ShowdownServerPool
 
 
 if __name__ == "__main__":
+    server_pool = None
     if config.get_train_against_ladder():
         server_configuration=ShowdownServerConfiguration
         validate = False
         log_level = logging.INFO
+    elif config.get_use_local_simulator():
+        server_configuration = LocalShowdownServer(seed=config.get_local_simulator_seed()).server_configuration
+        validate = True
+        log_level = logging.WARNING
     else:
-        thread = threading.Thread(target=start_showdown)
-        thread.start()
-        server_configuration = None
+        server_pool = ShowdownServerPool(config.get_num_showdown_servers(),
+            base_port=config.get_showdown_base_port(),
+            health_check_interval=config.get_showdown_health_check_interval())
+        server_pool.start()
+        server_configuration = server_pool.acquire()
         validate = True
         log_level = logging.WARNING
 
-    env_player = RLPlayer(battle_format="gen8randombattle",
-        avatar=120,
-        train=True,
-        validate=validate,
-        log_level=log_level,
-        load_from_checkpoint=config.get_load_from_checkpoint(),
-        player_configuration=PlayerConfiguration(config.get_bot_username(), config.get_bot_password()),
-        server_configuration=server_configuration)
+    if config.get_train_against_ladder() and config.get_ladder_concurrent_battles() > 1:
+        # The ladder games are played under our account by a separate player sharing this one's model
+        env_player = RLPlayer(battle_format="gen8randombattle",
+            train=False,
+            validate=False,
+            log_level=log_level,
+            load_from_checkpoint=config.get_load_from_checkpoint(),
+            server_configuration=server_configuration,
+            start_listening=False)
+        env_player.play_ladder(config.get_num_ladder_games(),
+            PlayerConfiguration(config.get_bot_username(), config.get_bot_password()),
+            avatar=120)
+    else:
+        # The stand-in server's challstr is fake, so logging in with a password would be rejected by the real login server
+        password = None if config.get_use_local_simulator() else config.get_bot_password()
+        try:
+            env_player = RLPlayer(battle_format="gen8randombattle",
+                avatar=120,
+                train=True,
+                validate=validate,
+                log_level=log_level,
+                load_from_checkpoint=config.get_load_from_checkpoint(),
+                player_configuration=PlayerConfiguration(config.get_bot_username(), password),
+                server_configuration=server_configuration,
+                server_pool=server_pool)
+        finally:
+            config.close_all_opponents()
+            if server_pool is not None:
+                server_pool.release(server_configuration)
+                server_pool.stop()
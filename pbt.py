@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Population-based training (Jaderberg et al., 2017).
+# A population of learners trains in parallel, each as its own main.py process with its own config,
+# Showdown ports and checkpoint directory. After every interval each learner is scored by its mean win
+# rate against the baselines. The worst learners then copy the checkpoint of one of the best ones,
+# and carry on with that learner's hyperparameters, perturbed a little:
+#   python pbt.py --population 8 --interval 20000 --generations 25
+
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+
+from tabulate import tabulate
+
+import src.geniusect.config as config
+
+from src.geniusect.evaluation.trial_process import sample_params, score_trial, start_trial, trial_checkpoint_dir, write_trial_config
+
+# Continuous hyperparameters are multiplied by one of PERTURB_FACTORS when copied, and clipped to their range
+DEFAULT_SPACE = {
+    "Train.LearningRate": {"type": "log_uniform", "low": 0.00001, "high": 0.1},
+    "DQN.Gamma": {"type": "uniform", "low": 0.9, "high": 0.999},
+    "DQN.DeltaClip": {"type": "uniform", "low": 0.5, "high": 5.0},
+    "Rewards.FaintedReward": {"type": "uniform", "low": 0.5, "high": 5.0},
+    "Rewards.HPReward": {"type": "uniform", "low": 1.0, "high": 30.0},
+    "Rewards.VictoryReward": {"type": "uniform", "low": 0.5, "high": 30.0},
+}
+PERTURB_FACTORS = (0.8, 1.2)
+# Chance of picking a new value for a choice hyperparameter when it is copied
+RESAMPLE_PROBABILITY = 0.25
+
+PBT_DIR = os.path.join("data", "pbt")
+
+# The files a Keras weights checkpoint is made of
+CHECKPOINT_FILES = ("checkpoint", "geniusect.ckpt.")
+
+def member_dir(run_name : str, member : int) -> str:
+    return os.path.join(PBT_DIR, run_name, "member-" + str(member).zfill(2))
+
+def perturb(params : dict, space : dict, rng : random.Random) -> dict:
+    perturbed = {}
+    for name, value in params.items():
+        distribution = space[name]
+        if distribution["type"] == "choice":
+            perturbed[name] = rng.choice(distribution["values"]) if rng.random() < RESAMPLE_PROBABILITY else value
+        else:
+            perturbed[name] = min(max(value * rng.choice(PERTURB_FACTORS), distribution["low"]), distribution["high"])
+    return perturbed
+
+def copy_checkpoint(source_dir : str, target_dir : str, battle_format : str) -> None:
+    """
+    Replaces the weights in target_dir with those in source_dir. The evaluation ledger is left alone.
+    """
+    source = trial_checkpoint_dir(source_dir, battle_format)
+    target = trial_checkpoint_dir(target_dir, battle_format)
+    os.makedirs(target, exist_ok=True)
+    for file_name in os.listdir(target):
+        if file_name.startswith(CHECKPOINT_FILES):
+            os.remove(os.path.join(target, file_name))
+    for file_name in os.listdir(source):
+        if file_name.startswith(CHECKPOINT_FILES):
+            shutil.copy2(os.path.join(source, file_name), os.path.join(target, file_name))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Population-based training")
+    parser.add_argument("--name", default=time.strftime("%Y%m%d-%H%M%S"))
+    parser.add_argument("--space", default=None, help="JSON file of the hyperparameters to tune; see DEFAULT_SPACE")
+    parser.add_argument("--population", type=int, default=8)
+    parser.add_argument("--interval", type=int, default=20000, help="Training steps between exploit/explore rounds")
+    parser.add_argument("--generations", type=int, default=25)
+    parser.add_argument("--truncation", type=float, default=0.25, help="Fraction of the population that copies, and is copied from")
+    parser.add_argument("--format", default="gen8randombattle")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    base_config_path = os.environ.get(config.AI_CONFIG_ENV, "ai_variables.cfg")
+    if config.get_train_against_ladder():
+        raise SystemExit("Learners are scored against the baselines, so they can't train against the ladder")
+
+    space = DEFAULT_SPACE
+    if args.space is not None:
+        with open(args.space, "r") as space_file:
+            space = json.load(space_file)
+
+    rng = random.Random(args.seed)
+    population = [sample_params(space, rng) for _ in range(args.population)]
+    n_truncated = max(int(args.population * args.truncation), 1)
+    results_path = os.path.join(PBT_DIR, args.name, "results.jsonl")
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+
+    # PBT takes over the learning rate schedule
+    overrides = {"Train.LearningRateDecay": False}
+
+    for generation in range(args.generations):
+        print("Generation %d: training %d learners for %d steps" % (generation, args.population, args.interval))
+        processes = []
+        try:
+            for member, params in enumerate(population):
+                directory = member_dir(args.name, member)
+                config_path = write_trial_config(base_config_path, directory, params, args.interval, member, overrides)
+                processes.append(start_trial(directory, config_path, "generation-" + str(generation) + ".log"))
+            for process in processes:
+                process.wait()
+        except KeyboardInterrupt:
+            print("\nStopping population-based training")
+            for process in processes:
+                process.terminate()
+                process.wait()
+            break
+        finally:
+            for process in processes:
+                process.log_file.close()
+
+        scores = [score_trial(member_dir(args.name, member), args.format) if process.returncode == 0 else 0.0
+                  for member, process in enumerate(processes)]
+        with open(results_path, "a") as results_file:
+            for member, params in enumerate(population):
+                results_file.write(json.dumps({"generation": generation, "member": member, "steps": (generation + 1) * args.interval,
+                                               "win_rate": scores[member], "params": params}) + "\n")
+
+        names = list(space.keys())
+        ranking = sorted(range(args.population), key=lambda member: scores[member], reverse=True)
+        print(tabulate([[member, "%.3f" % scores[member]] + ["%.4g" % population[member][name] if isinstance(population[member][name], float) else population[member][name] for name in names]
+                        for member in ranking], headers=["Member", "Win Rate"] + names))
+
+        if generation == args.generations - 1:
+            break
+
+        # Exploit: the bottom of the population restarts from the top; explore: with perturbed hyperparameters
+        for loser in ranking[-n_truncated:]:
+            winner = rng.choice(ranking[:n_truncated])
+            if winner == loser:
+                continue
+            copy_checkpoint(member_dir(args.name, winner), member_dir(args.name, loser), args.format)
+            population[loser] = perturb(population[winner], space, rng)
+            print("Member %d copies member %d" % (loser, winner))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# Rebuilds training trajectories from the protocol logs RecordProtocolLogs saves, using the current embed_battle.
+# Each worker process replays whole battles through poke-env's Battle; the results are written as shards
+# that train_offline.py reads:
+#   python reembed_logs.py --processes 8
+#   python train_offline.py --trajectories data/trajectories/gen8randombattle-reembedded
+
+import argparse
+import glob
+import multiprocessing
+import os
+import time
+
+import src.geniusect.config as config
+
+from src.geniusect.neural_net.trajectory_recorder import read_index, write_shard
+from src.geniusect.player.protocol_log import PROTOCOL_LOG_EXTENSION, replay_protocol_log
+
+# The player each worker embeds battles with
+_rl_player = None
+
+def _start_worker(battle_format : str) -> None:
+    global _rl_player
+    from src.geniusect.player.reinforcement_learning_player import RLPlayer
+    _rl_player = RLPlayer(train=False, validate=False, battle_format=battle_format, start_listening=False)
+
+def _replay(path : str):
+    try:
+        return path, replay_protocol_log(path, _rl_player)
+    except Exception as e:
+        print("Unable to replay " + path + ": " + str(e))
+        return path, []
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild trajectories from protocol logs with the current embedding")
+    parser.add_argument("--format", default="gen8randombattle")
+    parser.add_argument("--logs", default=None, help="Directory of protocol logs; defaults to the configured ProtocolLogDir")
+    parser.add_argument("--output", default=None, help="Where to write the shards; defaults to the trajectory directory with -reembedded added")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-episodes", type=int, default=256, help="Battles per shard")
+    args = parser.parse_args()
+
+    log_dir = args.logs if args.logs is not None else config.get_protocol_log_dir(args.format)
+    output_dir = args.output if args.output is not None else config.get_trajectory_dir(args.format) + "-reembedded"
+    if len(read_index(output_dir)) > 0:
+        # Mixing embeddings in one dataset would make it useless
+        raise SystemExit(output_dir + " already holds trajectories; pick another --output")
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = sorted(glob.glob(os.path.join(log_dir, "*" + PROTOCOL_LOG_EXTENSION)))
+    if len(paths) == 0:
+        raise SystemExit("No protocol logs in " + log_dir)
+    print("Re-embedding " + str(len(paths)) + " battles with " + str(args.processes) + " processes")
+
+    start_time = time.time()
+    episodes = []
+    n_shards = 0
+    n_steps = 0
+    with multiprocessing.Pool(args.processes, initializer=_start_worker, initargs=(args.format,)) as pool:
+        for path, steps in pool.imap_unordered(_replay, paths, chunksize=8):
+            if len(steps) == 0:
+                continue
+            episodes.append(steps)
+            n_steps += len(steps)
+            if len(episodes) >= args.shard_episodes:
+                n_shards += 1
+                write_shard(output_dir, episodes, n_shards)
+                episodes = []
+
+    if len(episodes) > 0:
+        n_shards += 1
+        write_shard(output_dir, episodes, n_shards)
+
+    print("Wrote " + str(n_steps) + " steps in " + str(n_shards) + " shards to " + output_dir + " in " + str(time.time() - start_time) + " seconds")
@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 
-# Update our stored data with the most recent from the server
-from numpy.lib.polynomial import RankWarning
-import src.geniusect.update_data as updater
-updater.update_pokedex()
-updater.update_itemdex()
-updater.update_movedex()
-updater.update_learnset()
+# Importing this module only parses the .cfg files.
+# Anything expensive happens in explicit stages, so that lightweight processes
+# (baseline opponents, tools, benchmarks) can read the config cheaply:
+#   update_data()   - refreshes the dex JSON files under poke_env/data and recompiles the data bundle
+#   build_model()   - imports TensorFlow
+#   build_dqn()     - imports keras-rl
+#   plot_history()  - imports matplotlib
+#   opponents       - players are only built the first time they are used
 
 import codecs
 import configparser
@@ -18,20 +19,15 @@ import sys
 import time
 import shutil
 
-import matplotlib.pyplot as plt
-import numpy as np
+from typing import TYPE_CHECKING, Optional
 
-from tensorflow.keras.layers import Dense, Flatten, Dropout, LeakyReLU, LSTM, Activation
-from tensorflow.keras.models import Sequential, Model
-from tensorflow.keras.optimizers import Adam
+from src.geniusect.evaluation.stopping_rules import StoppingRule, SPRTStoppingRule, ConfidenceIntervalStoppingRule
+from src.geniusect.player.opponent_registry import OpponentRegistry
 
-from src.geniusect.neural_net.dqn_agent import DQNAgent
-from rl.policy import LinearAnnealedPolicy, EpsGreedyQPolicy
-from rl.memory import SequentialMemory
-
-from poke_env.player_configuration import PlayerConfiguration
-from poke_env.player.player import Player
-from poke_env.player.random_player import RandomPlayer
+if TYPE_CHECKING:
+    from tensorflow.keras.models import Model
+    from poke_env.player.player import Player
+    from src.geniusect.neural_net.dqn_history import DQNHistory
 
 
 log_level=logging.INFO
@@ -40,11 +36,23 @@ log_level=logging.INFO
 secret_config = configparser.ConfigParser()
 secret_config.read(["secrets.cfg"])
 
+# Set this to run with another set of AI variables, such as a hyperparameter sweep trial's
+AI_CONFIG_ENV = "GENIUSECT_AI_CONFIG"
+
 ai_config = configparser.ConfigParser()
-ai_config.read(["ai_variables.cfg"])
+ai_config.read([os.environ.get(AI_CONFIG_ENV, "ai_variables.cfg")])
 
 MEMORY_WINDOW = 5
 
+def update_data() -> None:
+    # Update our stored data with the most recent from the server
+    import src.geniusect.update_data as updater
+    updater.update_pokedex()
+    updater.update_itemdex()
+    updater.update_movedex()
+    updater.update_learnset()
+    updater.compile_data_bundle()
+
 def get_starting_tryhard() -> float:
     return float(ai_config.get("Opponent", "StartingTryhard"))
 
@@ -87,38 +95,159 @@ def get_num_evaluation_episodes() -> int:
 def get_train_against_ladder() -> bool:
     return ai_config.get("Opponent", "Opponent").lower() == "ladder"
 
-from src.geniusect.neural_net.dqn_history import DQNHistory
-from src.geniusect.player.max_damage_player import MaxDamagePlayer
-from src.geniusect.player.default_player import DefaultPlayer
-from poke_env.player.baselines import SimpleHeuristicsPlayer
-
-if get_train_against_ladder():
-    opponents = {}
-else:
-    opponents = {
-        "default": DefaultPlayer(battle_format="gen8randombattle"), 
-        "random": RandomPlayer(battle_format="gen8randombattle"), 
-        "max": MaxDamagePlayer(battle_format="gen8randombattle"),
-        "heuristics": SimpleHeuristicsPlayer(battle_format="gen8randombattle")
-    }
+def get_parallel_evaluation() -> bool:
+    return ai_config.getboolean("Evaluation", "Parallel")
+
+def get_evaluation_concurrent_battles() -> int:
+    return int(ai_config.get("Evaluation", "ConcurrentBattles"))
+
+def get_evaluation_stop_rule() -> str:
+    return ai_config.get("Evaluation", "StopRule").lower()
+
+def get_evaluation_min_episodes() -> int:
+    return int(ai_config.get("Evaluation", "MinEpisodes"))
+
+def get_sprt_lower_win_rate() -> float:
+    return float(ai_config.get("Evaluation", "SPRTLowerWinRate"))
 
-def get_opponent(battle_format = "gen8randombattle", cycle_count = 0) -> Player:
+def get_sprt_upper_win_rate() -> float:
+    return float(ai_config.get("Evaluation", "SPRTUpperWinRate"))
+
+def get_sprt_alpha() -> float:
+    return float(ai_config.get("Evaluation", "SPRTAlpha"))
+
+def get_sprt_beta() -> float:
+    return float(ai_config.get("Evaluation", "SPRTBeta"))
+
+def get_ci_half_width() -> float:
+    return float(ai_config.get("Evaluation", "CIHalfWidth"))
+
+def get_ci_z() -> float:
+    return float(ai_config.get("Evaluation", "CIZ"))
+
+def get_evaluation_settings() -> dict:
+    """
+    Everything that changes how many episodes an evaluation plays, so that results are only reused
+    by evaluations that would have played them the same way.
+    """
+    settings = {
+        "episodes": get_num_evaluation_episodes(),
+        "parallel": get_parallel_evaluation(),
+        "stop_rule": get_evaluation_stop_rule(),
+        "min_episodes": get_evaluation_min_episodes()
+    }
+    if settings["stop_rule"] == "sprt":
+        settings.update({"lower_win_rate": get_sprt_lower_win_rate(), "upper_win_rate": get_sprt_upper_win_rate(),
+                         "alpha": get_sprt_alpha(), "beta": get_sprt_beta()})
+    elif settings["stop_rule"] == "ci":
+        settings.update({"half_width": get_ci_half_width(), "z": get_ci_z()})
+    return settings
+
+def get_opponent_idle_cycles() -> int:
+    return int(ai_config.get("Opponent", "OpponentIdleCycles"))
+
+def get_ladder_concurrent_battles() -> int:
+    return int(ai_config.get("Opponent", "LadderConcurrentBattles"))
+
+def get_num_ladder_games() -> int:
+    return int(ai_config.get("Opponent", "LadderGames"))
+
+def _build_opponent_registry(battle_format : str = "gen8randombattle", server_configuration = None) -> OpponentRegistry:
+    if get_train_against_ladder():
+        return OpponentRegistry({})
+
+    # Opponents accept several challenges at once so that they can be evaluated in parallel
+    opponent_concurrency = get_evaluation_concurrent_battles()
+
+    def build_default():
+        from src.geniusect.player.default_player import DefaultPlayer
+        from src.geniusect.local_server.local_showdown_server import start_player
+        return start_player(DefaultPlayer, server_configuration, battle_format=battle_format, max_concurrent_battles=opponent_concurrency)
+
+    def build_random():
+        from poke_env.player.random_player import RandomPlayer
+        from src.geniusect.local_server.local_showdown_server import start_player
+        return start_player(RandomPlayer, server_configuration, battle_format=battle_format, max_concurrent_battles=opponent_concurrency)
+
+    def build_max():
+        from src.geniusect.player.max_damage_player import MaxDamagePlayer
+        from src.geniusect.local_server.local_showdown_server import start_player
+        return start_player(MaxDamagePlayer, server_configuration, battle_format=battle_format, max_concurrent_battles=opponent_concurrency)
+
+    def build_heuristics():
+        from poke_env.player.baselines import SimpleHeuristicsPlayer
+        from src.geniusect.local_server.local_showdown_server import start_player
+        return start_player(SimpleHeuristicsPlayer, server_configuration, battle_format=battle_format, max_concurrent_battles=opponent_concurrency)
+
+    return OpponentRegistry({
+        "default": build_default,
+        "random": build_random,
+        "max": build_max,
+        "heuristics": build_heuristics
+    }, max_idle_cycles=get_opponent_idle_cycles())
+
+# One registry per Showdown server, since players can only battle others on the same server
+_opponent_registries = {}
+
+def get_opponents(server_configuration = None) -> OpponentRegistry:
+    server_url = None if server_configuration is None else server_configuration.server_url
+    if server_url not in _opponent_registries:
+        _opponent_registries[server_url] = _build_opponent_registry(server_configuration=server_configuration)
+    return _opponent_registries[server_url]
+
+def advance_opponent_cycle() -> None:
+    for registry in _opponent_registries.values():
+        registry.advance_cycle()
+
+def get_connected_opponents() -> dict:
+    """
+    Names of the opponents connected right now, by server.
+    """
+    return {server_url: set(registry.connected()) for server_url, registry in _opponent_registries.items()}
+
+def close_opponents_connected_since(connected_opponents : dict) -> None:
+    """
+    Closes every opponent that was not connected yet when get_connected_opponents returned connected_opponents.
+    """
+    for server_url, registry in _opponent_registries.items():
+        for name in registry.connected():
+            if name not in connected_opponents.get(server_url, set()):
+                registry.close(name)
+
+def close_opponents_on(server_configuration) -> None:
+    """
+    Closes every opponent connected to server_configuration, so that they are rebuilt with a new connection the next time they are used.
+    """
+    registry = _opponent_registries.get(server_configuration.server_url)
+    if registry is not None:
+        registry.close_all()
+
+def close_all_opponents() -> None:
+    for registry in _opponent_registries.values():
+        registry.close_all()
+
+# Opponents are only built (and connected to Showdown) the first time they are used
+opponents = get_opponents()
+
+def get_opponent(battle_format = "gen8randombattle", cycle_count = 0, server_configuration = None) -> "Player":
+    opponents = get_opponents(server_configuration)
     opponent_string = ai_config.get("Opponent", "Opponent").lower()
     opponent_num = cycle_count % len(opponents)
 
     if opponent_string == "ladder":
         return None
     elif opponent_string == "random" or (opponent_string == "cycle" and opponent_num == 0):
-        return opponents["random"]
+        return opponents.get("random")
     elif opponent_string == "default" or (opponent_string == "cycle" and opponent_num == 1):
-        return opponents["default"]
+        return opponents.get("default")
     elif opponent_string == "max" or (opponent_string == "cycle" and opponent_num == 2):
-        return opponents["max"]
+        return opponents.get("max")
     elif opponent_string == "heuristics" or (opponent_string == "cycle" and opponent_num == 3):
-        return opponents["heuristics"]
+        return opponents.get("heuristics")
     elif opponent_string == "self":
+        from poke_env.player_configuration import PlayerConfiguration
         from src.geniusect.player.reinforcement_learning_player import RLPlayer
-        return RLPlayer(train=False, validate=False, load_from_checkpoint=True, battle_format=battle_format, player_configuration=PlayerConfiguration("RL Player " + str(cycle_count), ""))
+        return RLPlayer(train=False, validate=False, load_from_checkpoint=True, battle_format=battle_format, player_configuration=PlayerConfiguration("RL Player " + str(cycle_count), ""), server_configuration=server_configuration)
     else:
         raise AttributeError()
 
@@ -131,6 +260,12 @@ def get_hidden_drop_percent() -> float:
 def get_learning_rate() -> float:
     return float(ai_config.get("Train", "LearningRate"))
 
+def get_learning_rate_decay() -> bool:
+    return ai_config.getboolean("Train", "LearningRateDecay")
+
+def get_win_rate_window() -> int:
+    return int(ai_config.get("Train", "WinRateWindow"))
+
 def get_epsilon() -> float:
     return float(ai_config.get("Train", "Epsilon"))
 
@@ -156,12 +291,87 @@ def get_checkpoint_dir(format = "") -> str:
             raise
     return complete_path
 
+def get_record_trajectories() -> bool:
+    return ai_config.getboolean("Saving", "RecordTrajectories")
+
+def get_trajectory_dir(format = "") -> str:
+    trajectory_dir = os.path.join("data", ai_config.get("Saving", "TrajectoryDir"))
+    if format != "":
+        trajectory_dir = os.path.join(trajectory_dir, format)
+    return trajectory_dir
+
+def get_trajectory_shard_mb() -> float:
+    return float(ai_config.get("Saving", "TrajectoryShardMB"))
+
+def get_trajectory_queue_episodes() -> int:
+    return int(ai_config.get("Saving", "TrajectoryQueueEpisodes"))
+
+def get_record_protocol_logs() -> bool:
+    return ai_config.getboolean("Saving", "RecordProtocolLogs")
+
+def get_protocol_log_dir(format = "") -> str:
+    protocol_log_dir = os.path.join("data", ai_config.get("Saving", "ProtocolLogDir"))
+    if format != "":
+        protocol_log_dir = os.path.join(protocol_log_dir, format)
+    return protocol_log_dir
+
 def get_tensorboard_log_dir(format = "") -> str:
     return get_checkpoint_dir(format)
 
 def get_step_timeout() -> float:
     return float(ai_config.get("Execution", "StepTimeout"))
 
+def get_num_showdown_servers() -> int:
+    return int(ai_config.get("Execution", "ShowdownServers"))
+
+def get_showdown_base_port() -> int:
+    return int(ai_config.get("Execution", "ShowdownBasePort"))
+
+def get_showdown_health_check_interval() -> float:
+    return float(ai_config.get("Execution", "ShowdownHealthCheckInterval"))
+
+def get_use_local_simulator() -> bool:
+    return ai_config.getboolean("Execution", "UseLocalSimulator")
+
+def get_local_simulator_seed() -> int:
+    return int(ai_config.get("Execution", "LocalSimulatorSeed"))
+
+def get_inference_batch_size() -> int:
+    return int(ai_config.get("Execution", "InferenceBatchSize"))
+
+def get_inference_batch_delay_ms() -> float:
+    return float(ai_config.get("Execution", "InferenceBatchDelayMs"))
+
+def get_messages_per_second() -> float:
+    return float(ai_config.get("Execution", "MessagesPerSecond"))
+
+def get_message_burst() -> int:
+    return int(ai_config.get("Execution", "MessageBurst"))
+
+def get_chat_reserve() -> int:
+    return int(ai_config.get("Execution", "ChatReserve"))
+
+def get_render_every_steps() -> int:
+    return int(ai_config.get("Execution", "RenderEverySteps"))
+
+def get_render_every_seconds() -> float:
+    return float(ai_config.get("Execution", "RenderEverySeconds"))
+
+def get_render_log() -> Optional[str]:
+    render_log = ai_config.get("Execution", "RenderLog").strip()
+    return os.path.join("data", render_log) if render_log != "" else None
+
+def get_render_log_mb() -> int:
+    return int(ai_config.get("Execution", "RenderLogMB"))
+
+def get_finished_battles_kept() -> Optional[int]:
+    kept = int(ai_config.get("Execution", "FinishedBattlesKept"))
+    return kept if kept > 0 else None
+
+def get_finished_battle_max_age() -> Optional[float]:
+    max_age = float(ai_config.get("Execution", "FinishedBattleMaxAge"))
+    return max_age if max_age > 0 else None
+
 def get_num_warmup_steps() -> int:
     return int(ai_config.get("DQN", "NumberWarmupSteps"))
     
@@ -177,12 +387,30 @@ def get_delta_clip() -> float:
 def get_use_double_dqn() -> bool:
     return ai_config.getboolean("DQN", "UseDoubleDQN")
 
-def build_dqn(model : Model, output_layer_size : int):
-    memory = SequentialMemory(limit=20000, window_length=MEMORY_WINDOW)
+def get_replay_prefetch_depth() -> int:
+    return int(ai_config.get("DQN", "ReplayPrefetchDepth"))
+
+def get_use_async_learner() -> bool:
+    return ai_config.getboolean("DQN", "AsyncLearner")
+
+def get_replay_ratio() -> float:
+    return float(ai_config.get("DQN", "ReplayRatio"))
+
+def get_acting_model_sync_interval() -> int:
+    return int(ai_config.get("DQN", "ActingModelSyncInterval"))
+
+def build_dqn(model : "Model", output_layer_size : int):
+    from tensorflow.keras.optimizers import Adam
+    from rl.policy import LinearAnnealedPolicy
+    from src.geniusect.neural_net.dqn_agent import DQNAgent
+    from src.geniusect.neural_net.masked_memory import MaskedSequentialMemory
+    from src.geniusect.neural_net.masked_policy import MaskedEpsGreedyQPolicy, MaskedGreedyQPolicy
+
+    memory = MaskedSequentialMemory(limit=20000, window_length=MEMORY_WINDOW)
 
     # Simple epsilon greedy
     policy = LinearAnnealedPolicy(
-        EpsGreedyQPolicy(),
+        MaskedEpsGreedyQPolicy(),
         attr="eps",
         value_max=1.0,
         value_min=0.0,
@@ -195,12 +423,17 @@ def build_dqn(model : Model, output_layer_size : int):
         model=model,
         nb_actions=output_layer_size,
         policy=policy,
+        test_policy=MaskedGreedyQPolicy(),
         memory=memory,
         nb_steps_warmup=get_num_warmup_steps(),
         gamma=get_gamma(),
         target_model_update=get_target_model_update(),
         delta_clip=get_delta_clip(),
         enable_double_dqn=get_use_double_dqn(),
+        prefetch_depth=get_replay_prefetch_depth(),
+        async_learner=get_use_async_learner(),
+        replay_ratio=get_replay_ratio(),
+        acting_model_sync_interval=get_acting_model_sync_interval(),
     )
 
     print("Learning rate " + str(get_learning_rate()) + " and epsilon " + str(get_epsilon()))
@@ -210,7 +443,53 @@ def build_dqn(model : Model, output_layer_size : int):
     dqn.compile(optimizer, metrics=["mae"])
     return dqn
 
-def build_model(input_layer_size, nb_actions) -> Model:
+def build_inference_batcher(dqn):
+    # Batching only pays off when several battles wait on the same model
+    if get_inference_batch_size() <= 1:
+        return None
+
+    from src.geniusect.neural_net.inference_batcher import InferenceBatcher
+    return InferenceBatcher(dqn.compute_batch_q_values, max_batch_size=get_inference_batch_size(), max_delay_ms=get_inference_batch_delay_ms())
+
+def build_outbound_rate_limiter(server_url : str):
+    from src.geniusect.local_server.local_showdown_server import LOCAL_SERVER_PREFIX
+    # Our own servers don't throttle us
+    if get_messages_per_second() <= 0 or server_url.startswith(("localhost", "127.0.0.1", LOCAL_SERVER_PREFIX)):
+        return None
+
+    from src.geniusect.player.outbound_queue import RateLimiter
+    return RateLimiter(get_messages_per_second(), get_message_burst())
+
+def build_render_sink():
+    if get_render_every_steps() <= 0 and get_render_every_seconds() <= 0:
+        return None
+
+    from src.geniusect.render_sink import RenderSink
+    return RenderSink(get_render_every_steps(), get_render_every_seconds(), get_render_log(), max_bytes=get_render_log_mb() * 1024 * 1024)
+
+def build_evaluation_stop_rule() -> StoppingRule:
+    stop_rule = get_evaluation_stop_rule()
+    min_episodes = get_evaluation_min_episodes()
+
+    if stop_rule == "sprt":
+        return SPRTStoppingRule(
+            lower_win_rate=get_sprt_lower_win_rate(),
+            upper_win_rate=get_sprt_upper_win_rate(),
+            alpha=get_sprt_alpha(),
+            beta=get_sprt_beta(),
+            min_episodes=min_episodes
+        )
+    elif stop_rule == "ci":
+        return ConfidenceIntervalStoppingRule(half_width=get_ci_half_width(), z=get_ci_z(), min_episodes=min_episodes)
+    elif stop_rule == "none":
+        return StoppingRule()
+    else:
+        raise AttributeError()
+
+def build_model(input_layer_size, nb_actions) -> "Model":
+    from tensorflow.keras.layers import Dense, Flatten, Dropout, LeakyReLU, LSTM, Activation
+    from tensorflow.keras.models import Sequential
+
     model = Sequential()
 
 # #    model.add(Dense(input_layer_size, name="Input", input_shape=(MEMORY_WINDOW, input_layer_size)))
@@ -252,7 +531,11 @@ def build_model(input_layer_size, nb_actions) -> Model:
 
     return model
 
-def plot_history(history : DQNHistory, model_name : str, opponent_name : str, batch_num : int):
+def plot_history(history : "DQNHistory", model_name : str, opponent_name : str, batch_num : int):
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from numpy.lib.polynomial import RankWarning
+
     history_path = os.path.join("data", "models", model_name)
 
     try:
@@ -338,6 +621,8 @@ def plot_history(history : DQNHistory, model_name : str, opponent_name : str, ba
         plt.ylabel('Win Rate')
         plt.xlabel('Game')
         handles = plt.plot(history.history['win_rate'], label='Win Rate')
+        if 'rolling_win_rate' in history.history:
+            handles += plt.plot(history.history['rolling_win_rate'], label='Rolling Win Rate')
         plt.legend(handles=handles)
         plot_path = os.path.join(history_path, "win_rate.png")
         plt.savefig(plot_path)
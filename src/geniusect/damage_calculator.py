@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+import functools
+
+import numpy as np
+
+from poke_env.environment.move import Move
+from poke_env.environment.move_category import MoveCategory
+from poke_env.environment.pokemon import Pokemon
+from poke_env.environment.side_condition import SideCondition
+from poke_env.environment.status import Status
+
+from typing import Iterable, List, Optional, Tuple
+
+from src.geniusect.data_bundle import DataBundle, STATS, get_data_bundle, to_id_str
+
+# Random battle sets have 84 EVs and 31 IVs in every stat
+RANDOM_BATTLE_EV = 84
+RANDOM_BATTLE_IV = 31
+
+PHYSICAL = 0
+SPECIAL = 1
+# Status moves, and anything else, are 2 like in the bundle
+CATEGORY_IDS = {MoveCategory.PHYSICAL: PHYSICAL, MoveCategory.SPECIAL: SPECIAL}
+
+# Attack items, as (category they boost or None for both, multiplier on the attacking stat, multiplier on the damage)
+ATTACKER_ITEMS = {
+    "choiceband": (PHYSICAL, 1.5, 1.0),
+    "choicespecs": (SPECIAL, 1.5, 1.0),
+    "lifeorb": (None, 1.0, 1.3),
+}
+
+def _item(pkm : Pokemon) -> Optional[str]:
+    # Pokemon.item raises until poke-env has seen the item
+    try:
+        return pkm.item
+    except AttributeError:
+        return None
+
+def _ability(pkm : Pokemon) -> Optional[str]:
+    # An ability is only known once it has been revealed, unless the species can only have the one
+    if pkm.ability is not None:
+        return pkm.ability
+    possible_abilities = getattr(pkm, "possible_abilities", None) or {}
+    if len(possible_abilities) == 1:
+        return to_id_str(next(iter(possible_abilities.values())))
+    return None
+
+def boost_multiplier(boost : int) -> float:
+    return (2 + boost) / 2 if boost >= 0 else 2 / (2 - boost)
+
+def damage_rolls(level : float, base_power : np.ndarray, attack : np.ndarray, defense : np.ndarray, modifier : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The lowest and highest roll of the gen 8 damage formula, broadcast over every argument.
+    attack and defense are the boosted stats; modifier is everything applied after the base damage.
+    """
+    base = np.floor(np.floor(np.floor(2 * level / 5 + 2) * base_power * attack / defense) / 50) + 2
+    highest = np.floor(base * modifier)
+    lowest = np.floor(np.floor(base * 0.85) * modifier)
+    # Anything that does damage does at least 1
+    does_damage = (base_power > 0) & (modifier > 0)
+    return np.where(does_damage, np.maximum(lowest, 1), 0), np.where(does_damage, np.maximum(highest, 1), 0)
+
+class DamageCalculator():
+    """
+    Damage ranges for gen 8 random battles, worked out from level-scaled stats, boosts, STAB, the type chart,
+    weather, screens, burns and the most common items and abilities.
+    Every attacking move is computed against every defending candidate at once, and the stats of
+    each species and level are only computed once.
+    """
+    def __init__(self, data_bundle : Optional[DataBundle] = None):
+        self._data_bundle = data_bundle if data_bundle is not None else get_data_bundle()
+        # The type chart with a neutral row and column added at the end, so that a missing type (-1) is neutral
+        type_multipliers = self._data_bundle.type_multipliers
+        self._type_multipliers = np.ones((type_multipliers.shape[0] + 1, type_multipliers.shape[1] + 1), dtype=np.float32)
+        self._type_multipliers[:-1, :-1] = type_multipliers
+
+    @functools.lru_cache(maxsize=4096)
+    def stats(self, species : str, level : int) -> Optional[np.ndarray]:
+        """
+        The unboosted stats of species at level, in the order of data_bundle.STATS, or None if the species is unknown.
+        """
+        species_index = self._data_bundle.species_id(species)
+        if species_index < 0:
+            return None
+        return self._scale_stats(self._data_bundle.species_base_stats[species_index], level)
+
+    @functools.lru_cache(maxsize=4096)
+    def _move_data(self, move_id : str) -> Optional[Tuple[int, int, int, float]]:
+        # Base power, category, type and accuracy of the move
+        move_index = self._data_bundle.move_id(move_id)
+        if move_index < 0:
+            return None
+        return (int(self._data_bundle.move_base_power[move_index]), int(self._data_bundle.move_category[move_index]),
+                int(self._data_bundle.move_type[move_index]), float(self._data_bundle.move_accuracy[move_index]))
+
+    def _scale_stats(self, base_stats : Iterable[int], level : int) -> np.ndarray:
+        base_stats = np.asarray(base_stats, dtype=np.float32)
+        stats = np.floor((2 * base_stats + RANDOM_BATTLE_IV + RANDOM_BATTLE_EV // 4) * level / 100) + 5
+        stats[0] += level + 5
+        return stats
+
+    def _pokemon_stats(self, pkm : Pokemon) -> np.ndarray:
+        level = pkm.level or 100
+        stats = self.stats(pkm.species, level)
+        if stats is None:
+            stats = self._scale_stats([pkm.base_stats.get(stat, 0) for stat in STATS], level)
+        return stats
+
+    def _type_ids(self, pkm : Pokemon) -> List[int]:
+        return [self._data_bundle.type_id(pkm_type.name) for pkm_type in pkm.types if pkm_type is not None]
+
+    def _move_arrays(self, moves : List[Move]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # Base power, category, type and accuracy of each move; moves the bundle doesn't know come from poke-env
+        base_power = np.zeros(len(moves))
+        category = np.full(len(moves), 2)
+        move_type = np.full(len(moves), -1)
+        accuracy = np.ones(len(moves))
+        for i, move in enumerate(moves):
+            move_data = self._move_data(move.id)
+            if move_data is not None:
+                base_power[i], category[i], move_type[i], accuracy[i] = move_data
+            elif move.type is not None:
+                base_power[i] = move.base_power
+                category[i] = CATEGORY_IDS.get(move.category, 2)
+                move_type[i] = self._data_bundle.type_id(move.type.name)
+                accuracy[i] = move.accuracy
+        return base_power, category, move_type, accuracy
+
+    def damage_range(self, attacker : Pokemon, moves : List[Move], defenders : List[Pokemon], weather = None,
+                     defender_side_conditions : Iterable[SideCondition] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Lowest and highest damage of each move against each defender, as fractions of the defender's max HP.
+        Both are arrays of shape (len(moves), len(defenders)).
+        """
+        lowest, highest, _ = self._damage_range(attacker, moves, defenders, weather, defender_side_conditions)
+        return lowest, highest
+
+    def _damage_range(self, attacker : Pokemon, moves : List[Move], defenders : List[Pokemon], weather,
+                      defender_side_conditions : Iterable[SideCondition]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # damage_range, along with the accuracy of each move
+        n_moves = len(moves)
+        n_defenders = len(defenders)
+        if n_moves == 0 or n_defenders == 0:
+            return np.zeros((n_moves, n_defenders)), np.zeros((n_moves, n_defenders)), np.ones(n_moves)
+
+        base_power, category, move_type, accuracy = self._move_arrays(moves)
+        physical = category == PHYSICAL
+        base_power = np.where((category == PHYSICAL) | (category == SPECIAL), base_power, 0)
+
+        # Attacker: stats, boosts, ability and item, one value per move
+        attacker_stats = self._pokemon_stats(attacker)
+        attacker_boosts = attacker.boosts
+        attack = np.where(physical,
+                          attacker_stats[1] * boost_multiplier(attacker_boosts.get("atk", 0)),
+                          attacker_stats[3] * boost_multiplier(attacker_boosts.get("spa", 0)))
+        ability = _ability(attacker)
+        if ability in ("hugepower", "purepower"):
+            attack = np.where(physical, attack * 2, attack)
+        guts = ability == "guts" and attacker.status is not None
+        if guts:
+            attack = np.where(physical, attack * 1.5, attack)
+
+        item_modifier = np.ones(n_moves)
+        attacker_item = _item(attacker)
+        item = ATTACKER_ITEMS.get(attacker_item)
+        if item is not None:
+            item_category, stat_multiplier, damage_multiplier = item
+            boosted = np.ones(n_moves, dtype=bool) if item_category is None else category == item_category
+            attack = np.where(boosted, attack * stat_multiplier, attack)
+            item_modifier = np.where(boosted, damage_multiplier, 1.0)
+
+        attacker_types = self._type_ids(attacker)
+        stab = np.where(np.isin(move_type, attacker_types) & (move_type >= 0), 2.0 if ability == "adaptability" else 1.5, 1.0)
+        burn = np.where(physical & (attacker.status == Status.BRN) & (not guts), 0.5, 1.0)
+
+        weather_name = getattr(weather, "name", "")
+        weather_modifier = np.ones(n_moves)
+        fire = move_type == self._data_bundle.type_id("FIRE")
+        water = move_type == self._data_bundle.type_id("WATER")
+        if weather_name in ("SUNNYDAY", "DESOLATELAND"):
+            weather_modifier = np.where(fire, 1.5, np.where(water, 0.5, 1.0))
+        elif weather_name in ("RAINDANCE", "PRIMORDIALSEA"):
+            weather_modifier = np.where(water, 1.5, np.where(fire, 0.5, 1.0))
+
+        # Defenders: stats, boosts and types, one row per defender
+        defender_stats = np.array([self._pokemon_stats(defender) for defender in defenders])
+        defense = np.stack([
+            defender_stats[:, 2] * [boost_multiplier(defender.boosts.get("def", 0)) for defender in defenders],
+            defender_stats[:, 4] * [boost_multiplier(defender.boosts.get("spd", 0)) for defender in defenders]
+        ], axis=1)
+        defender_types = np.full((n_defenders, 2), -1)
+        for j, defender in enumerate(defenders):
+            types = self._type_ids(defender)
+            defender_types[j, :len(types)] = types[:2]
+
+        # Type effectiveness of every move against every defender, with missing types counting as neutral
+        effectiveness = self._type_multipliers[move_type[:, None], defender_types[None, :, 0]] * \
+                        self._type_multipliers[move_type[:, None], defender_types[None, :, 1]]
+        levitating = np.array([_ability(defender) == "levitate" for defender in defenders])
+        if levitating.any():
+            effectiveness = np.where((move_type == self._data_bundle.type_id("GROUND"))[:, None] & levitating[None, :], 0.0, effectiveness)
+
+        side_conditions = set(defender_side_conditions)
+        screen = np.ones(n_moves)
+        if SideCondition.AURORA_VEIL in side_conditions:
+            screen = np.full(n_moves, 0.5)
+        else:
+            if SideCondition.REFLECT in side_conditions:
+                screen = np.where(physical, 0.5, screen)
+            if SideCondition.LIGHT_SCREEN in side_conditions:
+                screen = np.where(physical, screen, 0.5)
+
+        expert_belt = np.where((effectiveness > 1) & (attacker_item == "expertbelt"), 1.2, 1.0)
+        modifier = (weather_modifier * stab * burn * screen * item_modifier)[:, None] * effectiveness * expert_belt
+        defense = np.where(physical[:, None], defense[None, :, 0], defense[None, :, 1])
+
+        lowest, highest = damage_rolls(attacker.level or 100, base_power[:, None], attack[:, None], defense, modifier)
+        max_hp = defender_stats[None, :, 0]
+        return lowest / max_hp, highest / max_hp, accuracy
+
+    def expected_damage(self, attacker : Pokemon, moves : List[Move], defenders : List[Pokemon], weather = None,
+                        defender_side_conditions : Iterable[SideCondition] = ()) -> np.ndarray:
+        """
+        Average damage of each move against each defender, as a fraction of the defender's max HP, allowing for misses.
+        """
+        lowest, highest, accuracy = self._damage_range(attacker, moves, defenders, weather, defender_side_conditions)
+        return (lowest + highest) / 2 * accuracy[:, None]
+
+_damage_calculator = None
+
+def get_damage_calculator() -> DamageCalculator:
+    """
+    Returns the process-wide damage calculator, so that its stats cache is shared.
+    """
+    global _damage_calculator
+    if _damage_calculator is None:
+        _damage_calculator = DamageCalculator()
+    return _damage_calculator
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from typing import Dict, List, Optional
+
+# Bump whenever the layout of the bundle changes; older bundles are then recompiled
+BUNDLE_VERSION = 1
+BUNDLE_MAGIC = b"GDEX"
+BUNDLE_PATH = os.path.join("data", "dex.bundle")
+
+DATA_DIR = os.path.join("poke_env", "data")
+SOURCE_FILES = ["pokedex.json", "moves.json", "items.json", "learnset.json", "typeChart.json"]
+
+STATS = ["hp", "atk", "def", "spa", "spd", "spe"]
+CATEGORIES = ["Physical", "Special", "Status"]
+
+# Arrays are aligned so that they can be viewed straight out of the mmap
+ALIGNMENT = 64
+
+def to_id_str(name : str) -> str:
+    # Same as poke_env.data.to_id_str, without importing (and parsing) all of poke_env's data
+    return "".join(char for char in name if char.isalnum()).lower()
+
+def _source_hash(data_dir : str) -> str:
+    source_hash = hashlib.sha256()
+    for file_name in SOURCE_FILES:
+        try:
+            with open(os.path.join(data_dir, file_name), "rb") as source_file:
+                source_hash.update(source_file.read())
+        except FileNotFoundError:
+            pass
+    return source_hash.hexdigest()
+
+def _load_json(data_dir : str, file_name : str):
+    try:
+        with open(os.path.join(data_dir, file_name), "r", encoding="utf-8") as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        return {}
+
+def _compile_tables(data_dir : str):
+    pokedex = _load_json(data_dir, "pokedex.json")
+    moves = _load_json(data_dir, "moves.json")
+    items = _load_json(data_dir, "items.json")
+    learnset = _load_json(data_dir, "learnset.json")
+    type_chart = _load_json(data_dir, "typeChart.json")
+
+    types = [str(entry["name"]).upper() for entry in type_chart]
+    type_index = {type_name: i for i, type_name in enumerate(types)}
+
+    # Damage multipliers, indexed by [attacking type, defending type]
+    type_multipliers = np.ones((len(types), len(types)), dtype=np.float32)
+    for entry in type_chart:
+        attacker = type_index[entry["name"].upper()]
+        for immunity in entry["immunes"]:
+            type_multipliers[attacker, type_index[immunity.upper()]] = 0.0
+        for weakness in entry["weaknesses"]:
+            type_multipliers[attacker, type_index[weakness.upper()]] = 0.5
+        for strength in entry["strengths"]:
+            type_multipliers[attacker, type_index[strength.upper()]] = 2.0
+
+    species_ids = list(pokedex)
+    species_base_stats = np.zeros((len(species_ids), len(STATS)), dtype=np.int16)
+    species_types = -np.ones((len(species_ids), 2), dtype=np.int8)
+    species_weight = np.zeros(len(species_ids), dtype=np.float32)
+    for i, species_id in enumerate(species_ids):
+        entry = pokedex[species_id]
+        for j, stat in enumerate(STATS):
+            species_base_stats[i, j] = entry.get("baseStats", {}).get(stat, 0)
+        for j, type_name in enumerate(entry.get("types", [])[:2]):
+            species_types[i, j] = type_index.get(type_name.upper(), -1)
+        species_weight[i] = entry.get("weightkg", 0.0)
+
+    move_ids = list(moves)
+    move_base_power = np.zeros(len(move_ids), dtype=np.int16)
+    move_accuracy = np.ones(len(move_ids), dtype=np.float32)
+    move_category = np.zeros(len(move_ids), dtype=np.int8)
+    move_type = -np.ones(len(move_ids), dtype=np.int8)
+    move_priority = np.zeros(len(move_ids), dtype=np.int8)
+    move_pp = np.zeros(len(move_ids), dtype=np.int8)
+    for i, move_id in enumerate(move_ids):
+        entry = moves[move_id]
+        move_base_power[i] = entry.get("basePower", 0)
+        # Moves that never miss have "accuracy": true
+        accuracy = entry.get("accuracy", True)
+        move_accuracy[i] = 1.0 if accuracy is True else accuracy / 100
+        move_category[i] = CATEGORIES.index(entry.get("category", "Status"))
+        move_type[i] = type_index.get(entry.get("type", "").upper(), -1)
+        move_priority[i] = entry.get("priority", 0)
+        move_pp[i] = min(entry.get("pp", 0), 127)
+
+    item_ids = list(items)
+    item_num = np.array([items[item_id].get("num", -1) for item_id in item_ids], dtype=np.int32)
+
+    # Learnsets are stored CSR-style: the moves of species i are learnset_moves[learnset_indptr[i]:learnset_indptr[i + 1]]
+    move_index = {move_id: i for i, move_id in enumerate(move_ids)}
+    learnset_indptr = np.zeros(len(species_ids) + 1, dtype=np.int32)
+    learnset_moves = []
+    for i, species_id in enumerate(species_ids):
+        species_moves = learnset.get(species_id, {}).get("learnset", {})
+        learnset_moves.extend(sorted(move_index[move_id] for move_id in species_moves if move_id in move_index))
+        learnset_indptr[i + 1] = len(learnset_moves)
+
+    tables = {
+        "species": species_ids,
+        "moves": move_ids,
+        "items": item_ids,
+        "types": types,
+        "categories": CATEGORIES,
+        "stats": STATS
+    }
+    arrays = {
+        "type_multipliers": type_multipliers,
+        "species_base_stats": species_base_stats,
+        "species_types": species_types,
+        "species_weight": species_weight,
+        "move_base_power": move_base_power,
+        "move_accuracy": move_accuracy,
+        "move_category": move_category,
+        "move_type": move_type,
+        "move_priority": move_priority,
+        "move_pp": move_pp,
+        "item_num": item_num,
+        "learnset_indptr": learnset_indptr,
+        "learnset_moves": np.array(learnset_moves, dtype=np.int16)
+    }
+    return tables, arrays
+
+def _align(offset : int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def compile_bundle(data_dir : str = DATA_DIR, bundle_path : str = BUNDLE_PATH, force : bool = False) -> bool:
+    """
+    Compiles the dex JSON files into a single binary bundle.
+    Returns False without doing anything if the bundle is already up to date.
+    """
+    source_hash = _source_hash(data_dir)
+    if not force:
+        try:
+            if DataBundle(bundle_path).source_hash == source_hash:
+                return False
+        except (FileNotFoundError, ValueError):
+            pass
+
+    tables, arrays = _compile_tables(data_dir)
+
+    # Work out where each array goes; offsets are relative to the start of the data section
+    array_layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        array_layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+
+    header = json.dumps({
+        "version": BUNDLE_VERSION,
+        "source_hash": source_hash,
+        "tables": tables,
+        "arrays": array_layout
+    }).encode("utf-8")
+
+    preamble_size = len(BUNDLE_MAGIC) + struct.calcsize("<II")
+    data_start = _align(preamble_size + len(header))
+
+    bundle_dir = os.path.dirname(bundle_path)
+    if bundle_dir != "":
+        os.makedirs(bundle_dir, exist_ok=True)
+
+    # Write to a temporary file first so that processes that have the old bundle mapped are not disturbed
+    temp_path = bundle_path + ".tmp"
+    with open(temp_path, "wb") as bundle_file:
+        bundle_file.write(BUNDLE_MAGIC)
+        bundle_file.write(struct.pack("<II", BUNDLE_VERSION, len(header)))
+        bundle_file.write(header)
+        for name, array in arrays.items():
+            bundle_file.seek(data_start + array_layout[name]["offset"])
+            bundle_file.write(np.ascontiguousarray(array).tobytes())
+    os.replace(temp_path, bundle_path)
+
+    return True
+
+class DataBundle():
+    """
+    Read-only view of a compiled dex bundle.
+    The arrays are memory-mapped rather than read, so every process that loads the bundle
+    shares the same page-cached copy.
+    """
+    def __init__(self, bundle_path : str = BUNDLE_PATH):
+        with open(bundle_path, "rb") as bundle_file:
+            self._mmap = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        preamble_size = len(BUNDLE_MAGIC) + struct.calcsize("<II")
+        if self._mmap[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError("Not a dex bundle: " + bundle_path)
+
+        version, header_size = struct.unpack("<II", self._mmap[len(BUNDLE_MAGIC):preamble_size])
+        if version != BUNDLE_VERSION:
+            raise ValueError("Dex bundle version " + str(version) + " is not supported (expected " + str(BUNDLE_VERSION) + ")")
+
+        header = json.loads(self._mmap[preamble_size:preamble_size + header_size].decode("utf-8"))
+        data_start = _align(preamble_size + header_size)
+
+        self.version = version
+        self.source_hash = header["source_hash"]
+
+        tables = header["tables"]
+        self.species = tables["species"]
+        self.moves = tables["moves"]
+        self.items = tables["items"]
+        self.types = tables["types"]
+        self.categories = tables["categories"]
+
+        self.species_index = {species_id: i for i, species_id in enumerate(self.species)}
+        self.move_index = {move_id: i for i, move_id in enumerate(self.moves)}
+        self.item_index = {item_id: i for i, item_id in enumerate(self.items)}
+        self.type_index = {type_name: i for i, type_name in enumerate(self.types)}
+
+        for name, layout in header["arrays"].items():
+            dtype = np.dtype(layout["dtype"])
+            count = int(np.prod(layout["shape"]))
+            if count == 0:
+                array = np.zeros(0, dtype=dtype)
+            else:
+                array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=data_start + layout["offset"])
+            setattr(self, name, array.reshape(layout["shape"]))
+
+    def species_id(self, name : str) -> int:
+        return self.species_index.get(to_id_str(name), -1)
+
+    def move_id(self, name : str) -> int:
+        return self.move_index.get(to_id_str(name), -1)
+
+    def item_id(self, name : str) -> int:
+        return self.item_index.get(to_id_str(name), -1)
+
+    def type_id(self, name : str) -> int:
+        return self.type_index.get(name.upper(), -1)
+
+    def learnset(self, species : int) -> np.ndarray:
+        return self.learnset_moves[self.learnset_indptr[species]:self.learnset_indptr[species + 1]]
+
+_bundle = None
+
+def get_data_bundle(bundle_path : str = BUNDLE_PATH) -> DataBundle:
+    """
+    Returns the process-wide bundle, compiling it first if it is missing or outdated.
+    """
+    global _bundle
+    if _bundle is None:
+        try:
+            _bundle = DataBundle(bundle_path)
+        except (FileNotFoundError, ValueError):
+            compile_bundle(bundle_path=bundle_path, force=True)
+            _bundle = DataBundle(bundle_path)
+    return _bundle
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import time
+
+from typing import Any, Dict, List, Optional
+
+class EvaluationLedger():
+    """
+    Append-only record of evaluation results, stored as one JSON object per line.
+    Results are keyed by a content hash of the model weights, the opponent id, the battle format and the
+    evaluation settings (episode budget and stop rule), so weights that have already been evaluated against
+    an opponent the same way never need to be evaluated again.
+    """
+    def __init__(self, path : str):
+        self.path = path
+        self._entries = {}
+        self._load()
+
+    @staticmethod
+    def hash_weights(model) -> str:
+        weights_hash = hashlib.sha256()
+        for weights in model.get_weights():
+            weights_hash.update(str(weights.shape).encode("utf-8"))
+            weights_hash.update(str(weights.dtype).encode("utf-8"))
+            weights_hash.update(weights.tobytes())
+        return weights_hash.hexdigest()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r") as ledger_file:
+                for line in ledger_file:
+                    line = line.strip()
+                    if line == "":
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A run that died mid-write can leave a partial last line
+                        continue
+                    self._entries[self._key(entry["weights_hash"], entry["opponent"], entry["battle_format"], entry.get("settings"))] = entry
+        except FileNotFoundError:
+            pass
+
+    def _key(self, weights_hash : str, opponent_id : str, battle_format : str, settings : Optional[Dict[str, Any]] = None):
+        # Entries written before settings were recorded have none, and so never match an evaluation that has some
+        return (weights_hash, opponent_id, battle_format, json.dumps(settings, sort_keys=True))
+
+    def get(self, weights_hash : str, opponent_id : str, battle_format : str, settings : Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        return self._entries.get(self._key(weights_hash, opponent_id, battle_format, settings))
+
+    def record(self, weights_hash : str, opponent_id : str, battle_format : str, n_won : int, n_lost : int, n_played : int,
+               settings : Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        entry = {
+            "weights_hash": weights_hash,
+            "opponent": opponent_id,
+            "battle_format": battle_format,
+            "settings": settings,
+            "won": n_won,
+            "lost": n_lost,
+            "played": n_played,
+            "win_rate": n_won / n_played if n_played > 0 else 0.0,
+            "time": time.time()
+        }
+        self._entries[self._key(weights_hash, opponent_id, battle_format, settings)] = entry
+
+        with open(self.path, "a") as ledger_file:
+            ledger_file.write(json.dumps(entry) + "\n")
+
+        return entry
+
+    def query(self, weights_hash : Optional[str] = None, opponent_id : Optional[str] = None, battle_format : Optional[str] = None) -> List[Dict[str, Any]]:
+        results = []
+        for entry in self._entries.values():
+            if weights_hash is not None and not entry["weights_hash"].startswith(weights_hash):
+                continue
+            if opponent_id is not None and entry["opponent"] != opponent_id:
+                continue
+            if battle_format is not None and entry["battle_format"] != battle_format:
+                continue
+            results.append(entry)
+
+        return sorted(results, key=lambda entry: entry["time"])
+
+if __name__ == "__main__":
+    from tabulate import tabulate
+
+    parser = argparse.ArgumentParser(description="Query the evaluation results of earlier runs")
+    parser.add_argument("ledger", help="Path to an evaluation_ledger.jsonl file")
+    parser.add_argument("--weights", default=None, help="Weights hash, or a prefix of one")
+    parser.add_argument("--opponent", default=None)
+    parser.add_argument("--format", default=None)
+    args = parser.parse_args()
+
+    ledger = EvaluationLedger(args.ledger)
+    rows = [
+        [entry["weights_hash"][:12], entry["opponent"], entry["battle_format"], entry["won"], entry["lost"], entry["played"], "%.3f" % entry["win_rate"], time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["time"]))]
+        for entry in ledger.query(args.weights, args.opponent, args.format)
+    ]
+    print(tabulate(rows, headers=["Weights", "Opponent", "Format", "Won", "Lost", "Played", "Win Rate", "Time"]))
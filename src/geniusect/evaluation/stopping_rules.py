@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import math
+
+class StoppingRule():
+    """
+    Decides when an evaluation against one opponent has played enough games.
+    The base rule never stops early, so every requested episode is played.
+    """
+    def __init__(self, min_episodes : int = 0):
+        self.min_episodes = min_episodes
+
+    def should_stop(self, n_won : int, n_played : int) -> bool:
+        if n_played < max(self.min_episodes, 1):
+            return False
+        return self._is_settled(n_won, n_played)
+
+    def _is_settled(self, n_won : int, n_played : int) -> bool:
+        return False
+
+class SPRTStoppingRule(StoppingRule):
+    """
+    Wald's sequential probability ratio test on the win rate.
+    H0 is "win rate <= lower_win_rate", H1 is "win rate >= upper_win_rate".
+    We stop as soon as the log-likelihood ratio crosses either bound.
+    """
+    def __init__(self, lower_win_rate : float, upper_win_rate : float, alpha : float = 0.05, beta : float = 0.05, min_episodes : int = 0):
+        super(SPRTStoppingRule, self).__init__(min_episodes)
+
+        if not 0.0 < lower_win_rate < upper_win_rate < 1.0:
+            raise ValueError("SPRT win rates must satisfy 0 < lower < upper < 1")
+
+        self._win_llr = math.log(upper_win_rate / lower_win_rate)
+        self._loss_llr = math.log((1.0 - upper_win_rate) / (1.0 - lower_win_rate))
+        self._accept_h1 = math.log((1.0 - beta) / alpha)
+        self._accept_h0 = math.log(beta / (1.0 - alpha))
+
+    def log_likelihood_ratio(self, n_won : int, n_played : int) -> float:
+        return n_won * self._win_llr + (n_played - n_won) * self._loss_llr
+
+    def _is_settled(self, n_won : int, n_played : int) -> bool:
+        llr = self.log_likelihood_ratio(n_won, n_played)
+        return llr >= self._accept_h1 or llr <= self._accept_h0
+
+class ConfidenceIntervalStoppingRule(StoppingRule):
+    """
+    Stops once the Wilson score interval around the observed win rate
+    is narrower than +/- half_width. z is the normal quantile of the
+    interval (1.96 for 95% confidence).
+    """
+    def __init__(self, half_width : float, z : float = 1.96, min_episodes : int = 0):
+        super(ConfidenceIntervalStoppingRule, self).__init__(min_episodes)
+        self.half_width = half_width
+        self._z = z
+
+    def interval(self, n_won : int, n_played : int):
+        if n_played <= 0:
+            return (0.0, 1.0)
+
+        z_squared = self._z * self._z
+        win_rate = n_won / n_played
+        denominator = 1.0 + z_squared / n_played
+        center = (win_rate + z_squared / (2.0 * n_played)) / denominator
+        spread = self._z * math.sqrt(win_rate * (1.0 - win_rate) / n_played + z_squared / (4.0 * n_played * n_played)) / denominator
+        return (center - spread, center + spread)
+
+    def _is_settled(self, n_won : int, n_played : int) -> bool:
+        lower, upper = self.interval(n_won, n_played)
+        return (upper - lower) / 2.0 <= self.half_width
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import math
+
+from typing import Any, Dict, List, Optional, Tuple
+
+class Trial():
+    """
+    One set of hyperparameters in a sweep, and how it scored at each rung it reached.
+    """
+    def __init__(self, trial_id : int, params : Dict[str, Any]):
+        self.trial_id = trial_id
+        self.params = params
+        # Score at each rung this trial finished, by rung
+        self.scores = {}
+        self.running = False
+
+    @property
+    def rung(self) -> int:
+        """
+        Highest rung this trial has finished, or -1 if it hasn't finished any.
+        """
+        return max(self.scores.keys()) if len(self.scores) > 0 else -1
+
+    @property
+    def score(self) -> Optional[float]:
+        return self.scores[self.rung] if len(self.scores) > 0 else None
+
+class AshaScheduler():
+    """
+    Asynchronous successive halving (Li et al., 2018).
+    Rung k trains for min_steps * eta^k steps in total. Whenever a worker frees up, the scheduler promotes
+    a trial that is in the top 1/eta of its rung to the next one, or starts a new trial if nothing can be promoted.
+    Trials never wait for their rung to fill up, so every worker is always busy.
+    """
+    def __init__(self, n_trials : int, min_steps : int, max_steps : int, eta : int = 3):
+        if eta < 2:
+            raise ValueError("eta must be at least 2")
+        self.n_trials = n_trials
+        self.eta = eta
+        self.budgets = []
+        steps = min_steps
+        while steps < max_steps:
+            self.budgets.append(steps)
+            steps *= eta
+        self.budgets.append(max_steps)
+
+        self.trials = []
+
+    @property
+    def n_rungs(self) -> int:
+        return len(self.budgets)
+
+    def next_job(self, sample_params) -> Optional[Tuple[Trial, int]]:
+        """
+        The trial to run next and the rung to run it to, or None if nothing can run until a job finishes.
+        sample_params is called to pick the hyperparameters of a new trial.
+        """
+        # Promotions come first, from the top rung down, so the most promising trials finish soonest
+        for rung in reversed(range(self.n_rungs - 1)):
+            trial = self._promotable(rung)
+            if trial is not None:
+                trial.running = True
+                return trial, rung + 1
+
+        if len(self.trials) < self.n_trials:
+            trial = Trial(len(self.trials), sample_params())
+            trial.running = True
+            self.trials.append(trial)
+            return trial, 0
+
+        return None
+
+    def report(self, trial : Trial, rung : int, score : float) -> None:
+        trial.scores[rung] = score
+        trial.running = False
+
+    def is_finished(self) -> bool:
+        return len(self.trials) >= self.n_trials and not any(trial.running for trial in self.trials) and \
+            all(self._promotable(rung) is None for rung in range(self.n_rungs - 1))
+
+    def _promotable(self, rung : int) -> Optional[Trial]:
+        finished = [trial for trial in self.trials if rung in trial.scores]
+        n_promoted = math.floor(len(finished) / self.eta)
+        best = sorted(finished, key=lambda trial: trial.scores[rung], reverse=True)[:n_promoted]
+        for trial in best:
+            if trial.rung == rung and not trial.running:
+                return trial
+        return None
+
+    def leaderboard(self) -> List[Trial]:
+        """
+        Trials that got furthest first, and the best-scoring first within a rung.
+        """
+        return sorted(self.trials, key=lambda trial: (trial.rung, trial.score if trial.score is not None else -math.inf), reverse=True)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import configparser
+import math
+import os
+import random
+import subprocess
+import sys
+
+import src.geniusect.config as config
+
+from typing import Optional
+
+from src.geniusect.evaluation.evaluation_ledger import EvaluationLedger
+
+# Training runs that are started as separate main.py processes, each in a directory of its own
+# holding its config, its checkpoints, its evaluation ledger and its logs.
+
+def sample_params(space : dict, rng : random.Random) -> dict:
+    """
+    Picks a value for each "Section.Option" in space.
+    log_uniform and uniform distributions take "low" and "high"; choice takes "values".
+    """
+    params = {}
+    for name, distribution in space.items():
+        if distribution["type"] == "log_uniform":
+            params[name] = math.exp(rng.uniform(math.log(distribution["low"]), math.log(distribution["high"])))
+        elif distribution["type"] == "uniform":
+            params[name] = rng.uniform(distribution["low"], distribution["high"])
+        elif distribution["type"] == "choice":
+            params[name] = rng.choice(distribution["values"])
+        else:
+            raise ValueError("Unknown distribution for " + name + ": " + distribution["type"])
+    return params
+
+def write_trial_config(base_config_path : str, directory : str, params : dict, steps : int, worker : int, overrides : Optional[dict] = None) -> str:
+    """
+    Writes the config of a run that trains for steps steps with params, checkpointing into directory.
+    Each worker gets its own block of Showdown ports, so runs going at once never share a server.
+    """
+    trial_config = configparser.ConfigParser()
+    trial_config.read([base_config_path])
+
+    overrides = overrides if overrides is not None else {}
+    for name, value in list(params.items()) + list(overrides.items()):
+        section, option = name.split(".")
+        trial_config.set(section, option, str(value))
+
+    trial_config.set("Train", "NumTrainingSteps", str(steps))
+    # Checkpoints live under data/, like the default CheckpointDir
+    trial_config.set("Saving", "CheckpointDir", os.path.relpath(directory, "data"))
+    trial_config.set("Saving", "UseCheckpoint", "True")
+    trial_config.set("Saving", "AutoLoadFromCheckpoint", "True")
+    n_servers = trial_config.getint("Execution", "ShowdownServers")
+    trial_config.set("Execution", "ShowdownBasePort", str(trial_config.getint("Execution", "ShowdownBasePort") + worker * n_servers))
+
+    path = os.path.join(directory, "ai_variables.cfg")
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as config_file:
+        trial_config.write(config_file)
+    return path
+
+def start_trial(directory : str, config_path : str, log_name : str) -> subprocess.Popen:
+    """
+    Starts main.py with the given config. Its output goes to log_name in directory.
+    """
+    env = dict(os.environ)
+    env[config.AI_CONFIG_ENV] = config_path
+    log_file = open(os.path.join(directory, log_name), "w")
+    process = subprocess.Popen([sys.executable, "main.py"], env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    process.log_file = log_file
+    return process
+
+def trial_checkpoint_dir(directory : str, battle_format : str) -> str:
+    # Where config.get_checkpoint_dir puts a run's checkpoints when its CheckpointDir is directory
+    return os.path.join(directory, battle_format, "logs")
+
+def score_trial(directory : str, battle_format : str) -> float:
+    """
+    Mean win rate of the run's latest weights against the baselines, or 0 if they were never evaluated.
+    """
+    ledger_path = os.path.join(trial_checkpoint_dir(directory, battle_format), "evaluation_ledger.jsonl")
+    entries = EvaluationLedger(ledger_path).query(battle_format=battle_format)
+    if len(entries) == 0:
+        return 0.0
+    latest_hash = entries[-1]["weights_hash"]
+    win_rates = [entry["win_rate"] for entry in entries if entry["weights_hash"] == latest_hash]
+    return sum(win_rates) / len(win_rates)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import asyncio
+
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from src.geniusect.local_server.local_showdown_server import LocalShowdownServer
+
+class LocalConnection():
+    """
+    Stands in for the websocket a Player talks to Showdown over.
+    Messages the player sends are handed straight to the server, and messages from the server
+    are queued until the player's listening loop picks them up; nothing leaves the process.
+    """
+    def __init__(self, server : "LocalShowdownServer"):
+        self._server = server
+        self._messages = asyncio.Queue()
+        self.closed = False
+        self.user_id = None
+        self.username = None
+
+    async def send(self, message : str) -> None:
+        if self.closed:
+            raise ConnectionError("Connection to the local server is closed")
+        self._server.receive(self, message)
+
+    def push(self, message : Optional[str]) -> None:
+        if not self.closed:
+            self._messages.put_nowait(message)
+
+    async def close(self) -> None:
+        if self.closed:
+            return
+        self._server.disconnect(self)
+        # Wakes up the listening loop, which stops once it reaches the end of the queue
+        self._messages.put_nowait(None)
+        self.closed = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        message = await self._messages.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import random
+
+from poke_env.server_configuration import ServerConfiguration
+
+from src.geniusect.data_bundle import DataBundle, get_data_bundle, to_id_str
+from src.geniusect.local_server.local_connection import LocalConnection
+from src.geniusect.local_server.simulated_battle import SimulatedBattle, TeamGenerator
+from src.geniusect.showdown_pool import AUTHENTICATION_URL
+
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from poke_env.player.player import Player
+
+LOCAL_SERVER_PREFIX = "local-simulator-"
+
+# Every stand-in server that is up, by the server url it hands out
+_local_servers = {}
+
+class LocalShowdownServer():
+    """
+    In-process stand-in for a Showdown server.
+    It speaks the part of the protocol a Player relies on (logging in, challenges, ladder searches,
+    requests and battle messages), but battles are played by a simplified simulator and players are
+    wired to it over an in-memory connection instead of a websocket.
+    Battles are seeded from the server seed and the order they start in, so the same seed and the
+    same choices always give the same battles.
+    """
+    def __init__(self, seed : int = 0, team_size : int = 6, data_bundle : Optional[DataBundle] = None):
+        self._seed = seed
+        self._team_size = team_size
+        self._data_bundle = data_bundle if data_bundle is not None else get_data_bundle()
+        self._team_generator = TeamGenerator(self._data_bundle)
+
+        self._connections = {}
+        # Open challenges, by the user they were sent to
+        self._challenges = {}
+        # Users searching for a ladder battle, by format
+        self._searches = {}
+        self._battles = {}
+        self._battle_count = 0
+
+        self.server_configuration = ServerConfiguration(LOCAL_SERVER_PREFIX + str(id(self)), AUTHENTICATION_URL)
+        _local_servers[self.server_configuration.server_url] = self
+
+    @property
+    def battle_count(self) -> int:
+        return self._battle_count
+
+    def close(self) -> None:
+        for connection in list(self._connections.values()):
+            connection.push(None)
+        _local_servers.pop(self.server_configuration.server_url, None)
+
+    def connect(self, player : "Player") -> None:
+        """
+        Connects a player that was created with start_listening=False.
+        """
+        connection = LocalConnection(self)
+        player._websocket = connection
+        player._listening_coroutine = asyncio.ensure_future(self._listen(player, connection))
+        connection.push("|challstr|4|" + "0" * 128)
+
+    async def _listen(self, player : "Player", connection : LocalConnection) -> None:
+        # Same as Player.listen, minus the websocket
+        coroutines = set()
+        try:
+            async for message in connection:
+                player.logger.info("<<< %s", message)
+                coroutine = asyncio.ensure_future(player._handle_message(message))
+                coroutines.add(coroutine)
+                coroutine.add_done_callback(coroutines.discard)
+        except (asyncio.CancelledError, RuntimeError) as e:
+            player.logger.critical("Listen interrupted by %s", e)
+        except Exception as e:
+            player.logger.exception(e)
+        finally:
+            for coroutine in coroutines:
+                coroutine.cancel()
+
+    def disconnect(self, connection : LocalConnection) -> None:
+        if connection.user_id is None or self._connections.get(connection.user_id) is not connection:
+            return
+
+        user_id = connection.user_id
+        del self._connections[user_id]
+        self._challenges.pop(user_id, None)
+        for searching in self._searches.values():
+            if user_id in searching:
+                searching.remove(user_id)
+
+        # Leaving a battle forfeits it
+        for battle_tag, (battle, user_ids) in list(self._battles.items()):
+            if user_id in user_ids:
+                battle.forfeit(user_ids.index(user_id))
+                del self._battles[battle_tag]
+
+    def _push(self, user_id : str, message : str) -> None:
+        connection = self._connections.get(user_id)
+        if connection is not None:
+            connection.push(message)
+
+    def receive(self, connection : LocalConnection, message : str) -> None:
+        room, _, text = message.partition("|")
+        if not text.startswith("/"):
+            # Chat messages have nobody to read them
+            return
+
+        command, _, argument = text[1:].partition(" ")
+        if command == "trn":
+            self._log_in(connection, argument.split(",")[0])
+        elif connection.user_id is None:
+            connection.push("|popup|You need to log in first")
+        elif command == "challenge":
+            opponent, _, battle_format = argument.partition(",")
+            self._challenge(connection.user_id, to_id_str(opponent), battle_format.strip())
+        elif command == "accept":
+            self._accept(connection.user_id, to_id_str(argument))
+        elif command == "search":
+            self._search(connection.user_id, argument.strip())
+        elif command == "cancelsearch":
+            for searching in self._searches.values():
+                if connection.user_id in searching:
+                    searching.remove(connection.user_id)
+        elif command == "choose":
+            self._choose(connection.user_id, room, argument)
+        elif command == "forfeit":
+            battle, user_ids = self._battles.get(room, (None, []))
+            if connection.user_id in user_ids:
+                battle.forfeit(user_ids.index(connection.user_id))
+                del self._battles[room]
+        # Anything else (avatars, teams, timers, joining rooms) has no effect on simulated battles
+
+    def _log_in(self, connection : LocalConnection, username : str) -> None:
+        user_id = to_id_str(username)
+        existing = self._connections.get(user_id)
+        if existing is not None and existing is not connection:
+            connection.push("|nametaken|" + username + "|Someone is already using the name \"" + username + "\".")
+            return
+
+        connection.user_id = user_id
+        connection.username = username
+        self._connections[user_id] = connection
+        connection.push("|updateuser| " + username + "|1|1|{}")
+
+    def _challenge(self, challenger : str, opponent : str, battle_format : str) -> None:
+        if opponent not in self._connections:
+            self._push(challenger, "|popup|The user '" + opponent + "' was not found.")
+            return
+
+        self._challenges.setdefault(opponent, {})[challenger] = battle_format
+        # Only announce the new challenge, so that the player does not queue the older ones twice
+        self._push(opponent, "|updatechallenges|" + json.dumps({"challengesFrom": {challenger: battle_format}, "challengeTo": None}))
+
+    def _accept(self, user_id : str, challenger : str) -> None:
+        battle_format = self._challenges.get(user_id, {}).pop(challenger, None)
+        if battle_format is None or challenger not in self._connections:
+            self._push(user_id, "|popup|" + challenger + " is not challenging you.")
+            return
+
+        self._start_battle(challenger, user_id, battle_format)
+
+    def _search(self, user_id : str, battle_format : str) -> None:
+        searching = self._searches.setdefault(battle_format, [])
+        opponents = [opponent for opponent in searching if opponent != user_id]
+        if len(opponents) == 0:
+            searching.append(user_id)
+            return
+
+        searching.remove(opponents[0])
+        self._start_battle(opponents[0], user_id, battle_format)
+
+    def _start_battle(self, player_1 : str, player_2 : str, battle_format : str) -> None:
+        self._battle_count += 1
+        battle_tag = "battle-" + battle_format + "-" + str(self._battle_count)
+        rng = random.Random(self._seed * 1000003 + self._battle_count)
+
+        user_ids = [player_1, player_2]
+        usernames = tuple(self._connections[user_id].username for user_id in user_ids)
+        teams = tuple(self._team_generator.generate(rng, self._team_size) for _ in user_ids)
+
+        def send(side : int, message : str) -> None:
+            self._push(user_ids[side], message)
+
+        battle = SimulatedBattle(battle_tag, battle_format, usernames, teams, self._data_bundle, rng, send)
+        self._battles[battle_tag] = (battle, user_ids)
+        battle.start()
+
+    def _choose(self, user_id : str, battle_tag : str, choice : str) -> None:
+        battle, user_ids = self._battles.get(battle_tag, (None, []))
+        if user_id not in user_ids:
+            self._push(user_id, ">" + battle_tag + "\n|error|[Invalid choice] There's nothing to choose")
+            return
+
+        battle.choose(user_ids.index(user_id), choice)
+        if battle.finished:
+            del self._battles[battle_tag]
+
+def is_local_server(server_configuration : Optional[ServerConfiguration]) -> bool:
+    return server_configuration is not None and server_configuration.server_url in _local_servers
+
+def get_local_server(server_configuration : ServerConfiguration) -> LocalShowdownServer:
+    return _local_servers[server_configuration.server_url]
+
+def start_player(player_class, server_configuration : Optional[ServerConfiguration] = None, **kwargs) -> "Player":
+    """
+    Builds a player and connects it to server_configuration.
+    Players for a stand-in server are built without listening and then connected to it directly.
+    """
+    if not is_local_server(server_configuration):
+        return player_class(server_configuration=server_configuration, **kwargs)
+
+    player = player_class(server_configuration=server_configuration, start_listening=False, **kwargs)
+    get_local_server(server_configuration).connect(player)
+    return player
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+
+import json
+import math
+import random
+
+from poke_env.data import MOVES, POKEDEX
+
+from src.geniusect.data_bundle import DataBundle, STATS, to_id_str
+
+from typing import Callable, List, Tuple
+
+# Battles that drag on past this many turns are called a tie
+MAX_TURNS = 1000
+
+# Random battle style spreads: 31 IVs and 84 EVs in every stat
+IV = 31
+EV = 84
+
+# Used when a Pokemon has no PP left in any of its moves
+STRUGGLE = -1
+STRUGGLE_POWER = 50
+
+class SimulatedPokemon():
+    def __init__(self, data_bundle : DataBundle, species : int, level : int, moves : List[int]):
+        species_id = data_bundle.species[species]
+        dex_entry = POKEDEX[species_id]
+
+        self.species = species
+        self.name = dex_entry["name"]
+        self.level = level
+        self.ability = to_id_str(dex_entry["abilities"]["0"])
+        self.types = [int(type_id) for type_id in data_bundle.species_types[species] if type_id >= 0]
+
+        base_stats = [int(stat) for stat in data_bundle.species_base_stats[species]]
+        self.max_hp = (2 * base_stats[0] + IV + EV // 4) * level // 100 + level + 10
+        self.hp = self.max_hp
+        self.stats = {
+            stat: (2 * base + IV + EV // 4) * level // 100 + 5
+            for stat, base in zip(STATS[1:], base_stats[1:])
+        }
+
+        self.moves = moves
+        self.max_pp = [max(int(data_bundle.move_pp[move]) * 8 // 5, 1) for move in moves]
+        self.pp = list(self.max_pp)
+        self.active = False
+
+    @property
+    def fainted(self) -> bool:
+        return self.hp <= 0
+
+    @property
+    def details(self) -> str:
+        return self.name + ", L" + str(self.level)
+
+    def condition(self, public : bool = False) -> str:
+        if self.fainted:
+            return "0 fnt"
+        if public:
+            # Opponents only ever see HP as a percentage
+            return str(max(math.ceil(100 * self.hp / self.max_hp), 1)) + "/100"
+        return str(self.hp) + "/" + str(self.max_hp)
+
+class TeamGenerator():
+    """
+    Draws random teams from the dex bundle.
+    Only species with at least four damaging moves are used, since the simulator does not model status moves.
+    """
+    def __init__(self, data_bundle : DataBundle):
+        self._data_bundle = data_bundle
+
+        status = data_bundle.categories.index("Status")
+        damaging = (data_bundle.move_category != status) & (data_bundle.move_base_power > 0)
+
+        self._pool = []
+        for species, species_id in enumerate(data_bundle.species):
+            dex_entry = POKEDEX.get(species_id)
+            if dex_entry is None or dex_entry.get("num", 0) <= 0 or "battleOnly" in dex_entry:
+                continue
+
+            moves = [int(move) for move in data_bundle.learnset(species) if damaging[move] and data_bundle.moves[move] in MOVES]
+            if len(moves) >= 4:
+                self._pool.append((species, moves))
+
+    def __len__(self) -> int:
+        return len(self._pool)
+
+    def generate(self, rng : random.Random, team_size : int) -> List[SimulatedPokemon]:
+        team = []
+        for species, moves in rng.sample(self._pool, team_size):
+            # Stronger species get lower levels, like in random battles
+            base_stat_total = int(self._data_bundle.species_base_stats[species].sum())
+            level = max(70, min(100, 100 - (base_stat_total - 300) // 10))
+            team.append(SimulatedPokemon(self._data_bundle, species, level, rng.sample(moves, 4)))
+        return team
+
+class SimulatedBattle():
+    """
+    A heavily simplified singles battle: every move is a plain damaging hit, scaled by
+    the attacking and defending stats, STAB and the type chart. There are no abilities, items,
+    status conditions, weather or secondary effects.
+    What it does get right is the protocol: each side receives the same requests and battle
+    messages a Showdown server would send, so players cannot tell the difference.
+    """
+    def __init__(
+        self,
+        battle_tag : str,
+        battle_format : str,
+        usernames : Tuple[str, str],
+        teams : Tuple[List[SimulatedPokemon], List[SimulatedPokemon]],
+        data_bundle : DataBundle,
+        rng : random.Random,
+        send : Callable[[int, str], None]
+    ):
+        self.battle_tag = battle_tag
+        self.battle_format = battle_format
+        self.usernames = usernames
+        self.teams = teams
+        self.turn = 0
+        self.finished = False
+
+        self._data_bundle = data_bundle
+        self._rng = rng
+        self._send = send
+
+        self._active = [0, 0]
+        self._rqid = 0
+        # Sides we are waiting on, and what they chose
+        self._pending = set()
+        self._choices = {}
+        self._force_switch = False
+        self._log = ([], [])
+
+    def _side_id(self, side : int) -> str:
+        return "p" + str(side + 1)
+
+    def _ident(self, side : int, pokemon : SimulatedPokemon, position : bool = True) -> str:
+        return self._side_id(side) + ("a" if position else "") + ": " + pokemon.name
+
+    def active_pokemon(self, side : int) -> SimulatedPokemon:
+        return self.teams[side][self._active[side]]
+
+    def _log_all(self, line : str) -> None:
+        for log in self._log:
+            log.append(line)
+
+    def _log_condition(self, prefix : str, side : int, pokemon : SimulatedPokemon) -> None:
+        # Own Pokemon show their exact HP, the opponent's only a percentage
+        for viewer, log in enumerate(self._log):
+            log.append(prefix + "|" + pokemon.condition(public=viewer != side))
+
+    def _flush_log(self) -> None:
+        for side, log in enumerate(self._log):
+            if len(log) > 0:
+                self._send(side, ">" + self.battle_tag + "\n" + "\n".join(log))
+        self._log = ([], [])
+
+    def _send_request(self, side : int, force_switch : bool = False, wait : bool = False) -> None:
+        self._rqid += 1
+        request = {}
+        if wait:
+            request["wait"] = True
+        elif force_switch:
+            request["forceSwitch"] = [True]
+            request["noCancel"] = True
+        else:
+            active = self.active_pokemon(side)
+            request["active"] = [{
+                "moves": [
+                    {
+                        "move": MOVES[self._data_bundle.moves[move]]["name"],
+                        "id": self._data_bundle.moves[move],
+                        "pp": pp,
+                        "maxpp": max_pp,
+                        "target": MOVES[self._data_bundle.moves[move]]["target"],
+                        "disabled": pp <= 0
+                    }
+                    for move, pp, max_pp in zip(active.moves, active.pp, active.max_pp)
+                ]
+            }]
+
+        request["side"] = {
+            "name": self.usernames[side],
+            "id": self._side_id(side),
+            "pokemon": [
+                {
+                    "ident": self._ident(side, pokemon, position=False),
+                    "details": pokemon.details,
+                    "condition": pokemon.condition(),
+                    "active": pokemon.active,
+                    "stats": pokemon.stats,
+                    "moves": [self._data_bundle.moves[move] for move in pokemon.moves],
+                    "baseAbility": pokemon.ability,
+                    "item": "",
+                    "pokeball": "pokeball",
+                    "ability": pokemon.ability
+                }
+                for pokemon in self.teams[side]
+            ]
+        }
+        request["rqid"] = self._rqid
+        self._send(side, ">" + self.battle_tag + "\n|request|" + json.dumps(request))
+
+    def start(self) -> None:
+        for side in range(2):
+            self._send(side, ">" + self.battle_tag + "\n|init|battle\n|title|" + " vs. ".join(self.usernames))
+
+        for side in range(2):
+            self.active_pokemon(side).active = True
+            self._send_request(side)
+
+        for side, username in enumerate(self.usernames):
+            self._log_all("|player|" + self._side_id(side) + "|" + username + "|1|")
+        for side, team in enumerate(self.teams):
+            self._log_all("|teamsize|" + self._side_id(side) + "|" + str(len(team)))
+        self._log_all("|gametype|singles")
+        self._log_all("|gen|8")
+        self._log_all("|tier|" + self.battle_format)
+        self._log_all("|start")
+        for side in range(2):
+            self._log_switch(side)
+        self._next_turn()
+
+    def _log_switch(self, side : int) -> None:
+        pokemon = self.active_pokemon(side)
+        self._log_condition("|switch|" + self._ident(side, pokemon) + "|" + pokemon.details, side, pokemon)
+
+    def _next_turn(self) -> None:
+        if self.turn >= MAX_TURNS:
+            self._log_all("|tie")
+            self._end()
+            return
+
+        self.turn += 1
+        self._force_switch = False
+        self._pending = {0, 1}
+        self._choices = {}
+        for side in range(2):
+            self._send_request(side)
+        self._log_all("|turn|" + str(self.turn))
+        self._flush_log()
+
+    def _end(self) -> None:
+        self.finished = True
+        self._pending = set()
+        self._flush_log()
+
+    def _parse_choice(self, side : int, choice : str):
+        team = self.teams[side]
+        active = self.active_pokemon(side)
+
+        action, _, target = choice.strip().partition(" ")
+        if action == "switch":
+            for i, pokemon in enumerate(team):
+                if target == str(i + 1) or to_id_str(target) == to_id_str(pokemon.name):
+                    if not pokemon.fainted and not pokemon.active:
+                        return ("switch", i)
+        elif action == "move" and not self._force_switch:
+            # Mega evolving, z-moves and dynamaxing are not simulated, so those flags are ignored
+            target = target.split(" ")[0]
+            for i, move in enumerate(active.moves):
+                if target == str(i + 1) or target == self._data_bundle.moves[move]:
+                    if active.pp[i] > 0:
+                        return ("move", i)
+
+        return self._default_choice(side)
+
+    def _default_choice(self, side : int):
+        team = self.teams[side]
+        if self._force_switch:
+            for i, pokemon in enumerate(team):
+                if not pokemon.fainted and not pokemon.active:
+                    return ("switch", i)
+
+        active = self.active_pokemon(side)
+        for i, pp in enumerate(active.pp):
+            if pp > 0:
+                return ("move", i)
+        return ("move", STRUGGLE)
+
+    def choose(self, side : int, choice : str) -> None:
+        if side not in self._pending:
+            return
+
+        self._choices[side] = self._parse_choice(side, choice)
+        self._pending.discard(side)
+        if len(self._pending) > 0:
+            return
+
+        if self._force_switch:
+            for side, (_, slot) in sorted(self._choices.items()):
+                self._switch(side, slot)
+            self._next_turn()
+        else:
+            self._play_turn()
+
+    def forfeit(self, side : int) -> None:
+        if self.finished:
+            return
+        self._log_all("|win|" + self.usernames[1 - side])
+        self._end()
+
+    def _action_order(self, side : int):
+        action, slot = self._choices[side]
+        if action == "switch":
+            return (0, 0, 0, self._rng.random())
+
+        active = self.active_pokemon(side)
+        priority = 0 if slot == STRUGGLE else int(self._data_bundle.move_priority[active.moves[slot]])
+        return (1, -priority, -active.stats["spe"], self._rng.random())
+
+    def _play_turn(self) -> None:
+        for side in sorted(self._choices, key=self._action_order):
+            action, slot = self._choices[side]
+            if action == "switch":
+                self._switch(side, slot)
+            elif not self.active_pokemon(side).fainted:
+                self._use_move(side, slot)
+
+        self._log_all("|upkeep")
+
+        remaining = [sum(not pokemon.fainted for pokemon in team) for team in self.teams]
+        if remaining[0] == 0 or remaining[1] == 0:
+            if remaining[0] == remaining[1]:
+                self._log_all("|tie")
+            else:
+                self._log_all("|win|" + self.usernames[0 if remaining[0] > 0 else 1])
+            self._end()
+            return
+
+        fainted = [side for side in range(2) if self.active_pokemon(side).fainted]
+        if len(fainted) == 0:
+            self._next_turn()
+            return
+
+        # Sides with a fainted Pokemon have to send in a replacement before the next turn starts
+        self._flush_log()
+        self._force_switch = True
+        self._pending = set(fainted)
+        self._choices = {}
+        for side in range(2):
+            self._send_request(side, force_switch=side in fainted, wait=side not in fainted)
+
+    def _switch(self, side : int, slot : int) -> None:
+        self.active_pokemon(side).active = False
+        self._active[side] = slot
+        self.active_pokemon(side).active = True
+        self._log_switch(side)
+
+    def _use_move(self, side : int, slot : int) -> None:
+        attacker = self.active_pokemon(side)
+        defender = self.active_pokemon(1 - side)
+
+        if slot == STRUGGLE:
+            move_name = "Struggle"
+        else:
+            attacker.pp[slot] -= 1
+            move_name = MOVES[self._data_bundle.moves[attacker.moves[slot]]]["name"]
+
+        self._log_all("|move|" + self._ident(side, attacker) + "|" + move_name + "|" + self._ident(1 - side, defender))
+
+        if slot != STRUGGLE and self._rng.random() >= self._data_bundle.move_accuracy[attacker.moves[slot]]:
+            self._log_all("|-miss|" + self._ident(side, attacker) + "|" + self._ident(1 - side, defender))
+            return
+
+        damage, effectiveness = self._damage(attacker, defender, slot)
+        if effectiveness == 0:
+            self._log_all("|-immune|" + self._ident(1 - side, defender))
+            return
+        elif effectiveness > 1:
+            self._log_all("|-supereffective|" + self._ident(1 - side, defender))
+        elif effectiveness < 1:
+            self._log_all("|-resisted|" + self._ident(1 - side, defender))
+
+        defender.hp = max(defender.hp - damage, 0)
+        self._log_condition("|-damage|" + self._ident(1 - side, defender), 1 - side, defender)
+        if defender.fainted:
+            self._log_all("|faint|" + self._ident(1 - side, defender))
+
+    def _damage(self, attacker : SimulatedPokemon, defender : SimulatedPokemon, slot : int) -> Tuple[int, float]:
+        if slot == STRUGGLE:
+            base_power = STRUGGLE_POWER
+            category = "Physical"
+            move_type = -1
+        else:
+            move = attacker.moves[slot]
+            base_power = int(self._data_bundle.move_base_power[move])
+            category = self._data_bundle.categories[self._data_bundle.move_category[move]]
+            move_type = int(self._data_bundle.move_type[move])
+
+        if category == "Special":
+            attack, defense = attacker.stats["spa"], defender.stats["spd"]
+        else:
+            attack, defense = attacker.stats["atk"], defender.stats["def"]
+
+        effectiveness = 1.0
+        stab = 1.0
+        if move_type >= 0:
+            for defender_type in defender.types:
+                effectiveness *= float(self._data_bundle.type_multipliers[move_type, defender_type])
+            if move_type in attacker.types:
+                stab = 1.5
+
+        if effectiveness == 0:
+            return 0, effectiveness
+
+        base_damage = (2 * attacker.level // 5 + 2) * base_power * attack // defense // 50 + 2
+        damage = int(base_damage * self._rng.uniform(0.85, 1.0) * stab * effectiveness)
+        return max(damage, 1), effectiveness
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import threading
+
+from typing import Callable, List, Optional
+
+class AsyncLearner():
+    """
+    Runs gradient updates on a thread of its own, so that training doesn't hold up the battle.
+    The learner does as many updates as its budget allows (a replay ratio times the transitions
+    collected so far), and waits for more transitions once it has caught up.
+    Every sync_interval updates, the acting weights are refreshed from the trained ones.
+    """
+    def __init__(self, train_step : Callable[[], List[float]], sync_weights : Callable[[], None],
+                 update_budget : Callable[[], float], sync_interval : int = 50):
+        """
+        :param train_step: Does one gradient update, and returns its metrics.
+        :param sync_weights: Copies the trained weights to the model used for acting.
+        :param update_budget: How many updates the learner is allowed to have done so far.
+        :param sync_interval: Updates between weight syncs.
+        """
+        self._train_step = train_step
+        self._sync_weights = sync_weights
+        self._update_budget = update_budget
+        self._sync_interval = max(sync_interval, 1)
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.n_updates = 0
+        self.n_syncs = 0
+        self.metrics = None
+        self.error = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        # Act with everything learned so far
+        self._sync()
+
+    def _sync(self) -> None:
+        self._sync_weights()
+        self.n_syncs += 1
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            if self.n_updates >= self._update_budget():
+                # Caught up with the battles; wait for more transitions
+                self._stop_event.wait(0.001)
+                continue
+
+            try:
+                self.metrics = self._train_step()
+                self.n_updates += 1
+                if self.n_updates % self._sync_interval == 0:
+                    self._sync()
+            except Exception as e:
+                # Raised again on the battle's thread, the next time it checks in
+                self.error = e
+                return
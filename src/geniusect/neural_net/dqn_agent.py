@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+import threading
+import time
 import warnings
 from copy import deepcopy
 
@@ -7,6 +9,7 @@ import numpy as np
 from tensorflow.keras.callbacks import History
 
 from rl.agents.dqn import DQNAgent as RLDQNAgent
+from rl.util import clone_model
 
 from rl.callbacks import (
     CallbackList,
@@ -15,6 +18,10 @@ from rl.callbacks import (
     Visualizer
 )
 
+from src.geniusect.neural_net.async_learner import AsyncLearner
+from src.geniusect.neural_net.minibatch_prefetcher import MinibatchPrefetcher
+from src.geniusect.neural_net.running_stat import RunningStat
+
 class DQNAgent(RLDQNAgent):
     """
     # Arguments
@@ -27,10 +34,53 @@ class DQNAgent(RLDQNAgent):
             `avg`: Q(s,a;theta) = V(s;theta) + (A(s,a;theta)-Avg_a(A(s,a;theta)))
             `max`: Q(s,a;theta) = V(s;theta) + (A(s,a;theta)-max_a(A(s,a;theta)))
             `naive`: Q(s,a;theta) = V(s;theta) + A(s,a;theta)
+        prefetch_depth__: How many replay minibatches a background thread keeps ready while training. 0 samples them on the training step.
+        async_learner__: If `True`, gradient updates run on a learner thread of their own instead of on every step, and actions are chosen
+            by a copy of the model that is synced with the trained one every `acting_model_sync_interval` updates.
+            Keras models aren't safe to use from two threads at once, so the battle's thread never predicts with the trained model
+            while the learner runs, and the episode-end callbacks (checkpoints, early stopping) wait for the update in progress.
+        replay_ratio__: With `async_learner`, how many gradient updates the learner may do per transition added to the memory.
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, prefetch_depth=0, async_learner=False, replay_ratio=1.0, acting_model_sync_interval=50, **kwargs):
         super(DQNAgent, self).__init__(*args, **kwargs)
         self.best_q = None
+        # When set, returns which actions are legal right now, as a boolean array of length nb_actions.
+        # Illegal actions are never picked, and are left out of the Q-learning target.
+        self.action_mask_fn = None
+        self.recent_action_mask = None
+        # When set, returns the tag of the battle being played, for the step logs
+        self.battle_tag_fn = None
+
+        self.prefetch_depth = prefetch_depth
+        self._prefetcher = None
+        # The memory is sampled from other threads while the battle adds to it
+        self.memory_lock = threading.Lock()
+        self._n_memory_appends = 0
+        # Appends made while training, which is all the learner's update budget counts
+        self._n_training_appends = 0
+        self._learner_start_appends = 0
+
+        self.async_learner = async_learner
+        self.replay_ratio = replay_ratio
+        self.acting_model_sync_interval = acting_model_sync_interval
+        self._learner = None
+        self._n_learner_updates = 0
+        # Learner updates whose metrics have been handed to keras-rl already
+        self._n_reported_updates = 0
+        # Held by the learner for every update, and by whatever else touches the trained model while it runs
+        self._trained_model_lock = threading.Lock()
+        # Only used while the learner is running; the rest of the time we act with the trained model
+        self._acting_model = None
+        self._acting_model_lock = threading.Lock()
+
+
+    def compute_batch_q_values(self, state_batch):
+        if self._learner is None:
+            return super(DQNAgent, self).compute_batch_q_values(state_batch)
+
+        batch = self.process_state_batch(state_batch)
+        with self._acting_model_lock:
+            return self._acting_model.predict_on_batch(batch)
 
     def fit(self, env, nb_steps, action_repetition=1, callbacks=None, verbose=1,
             visualize=False, nb_max_start_steps=0, start_step_policy=None, log_interval=10000,
@@ -96,6 +146,8 @@ class DQNAgent(RLDQNAgent):
             callbacks._set_params(params)
         self._on_train_begin()
         callbacks.on_train_begin()
+        self._start_prefetcher()
+        self._start_learner()
 
         episode = np.int16(0)
         self.step = np.int16(0)
@@ -103,7 +155,7 @@ class DQNAgent(RLDQNAgent):
         episode_reward = None
         episode_step = None
         did_abort = False
-        episode_metric_list = {}
+        episode_metric_stats = {}
         try:
             while self.step < nb_steps and not self.trainable_model.stop_training:
                 if observation is None:  # start of a new episode
@@ -180,17 +232,26 @@ class DQNAgent(RLDQNAgent):
 
                 step_logs = {
                     'action': action,
+                    # The observation the action was taken on, and the one it led to
+                    'previous_observation': self.recent_observation,
                     'observation': observation,
                     'reward': reward,
+                    'done': done,
+                    'action_mask': self.recent_action_mask,
+                    'battle_tag': self.battle_tag_fn() if self.battle_tag_fn is not None else None,
                     'metrics': metrics,
                     'episode': episode,
                     'info': accumulated_info,
                 }
 
+                # Callbacks see the running mean of each metric over the episode so far
                 for name, metric in zip(self.metrics_names, metrics):
-                    episode_metric_list.setdefault(name, []).append(metric)
-
-                step_logs.update(episode_metric_list)
+                    stat = episode_metric_stats.get(name)
+                    if stat is None:
+                        stat = RunningStat()
+                        episode_metric_stats[name] = stat
+                    stat.push(metric)
+                    step_logs[name] = stat.mean
 
                 callbacks.on_step_end(episode_step, step_logs)
                 episode_step += 1
@@ -214,49 +275,289 @@ class DQNAgent(RLDQNAgent):
                         'nb_steps': self.step,
                     }
                     
-                    for name in episode_metric_list:
+                    for name, stat in episode_metric_stats.items():
                         if name == "loss":
                             new_name = "val_loss"
                         else:
                             new_name = name
 
-                        if not np.isnan(episode_metric_list[name]).all():  # not all values are means
-                            mean = np.nanmean(episode_metric_list[name], axis=0)
-                            episode_metrics[new_name] = mean
-                        else:
-                            episode_metrics[new_name] = np.nan
+                        # NaN if no step of the episode trained
+                        episode_metrics[new_name] = stat.mean
 
                     episode_logs.update(episode_metrics)
                     
-                    callbacks.on_episode_end(episode, episode_logs)
+                    if self._learner is not None:
+                        # Checkpointing reads the weights the learner is updating
+                        with self._trained_model_lock:
+                            callbacks.on_episode_end(episode, episode_logs)
+                    else:
+                        callbacks.on_episode_end(episode, episode_logs)
 
                     episode += 1
                     observation = None
                     episode_step = None
                     episode_reward = None
-                    episode_metric_list = {}
+                    episode_metric_stats = {}
         except KeyboardInterrupt:
             # We catch keyboard interrupts here so that training can be be safely aborted.
             # This is so common that we've built this right into this function, which ensures that
             # the `on_train_end` method is properly called.
             did_abort = True
+        finally:
+            self._stop_learner()
+            self._stop_prefetcher()
         callbacks.on_train_end(logs={'did_abort': did_abort})
         self._on_train_end()
 
         return history
 
+    def fit_offline(self, batches, nb_updates=None, log_interval=1000):
+        """Trains the agent on recorded minibatches, such as those of a TrajectoryDataset, without an environment.
+
+        # Arguments
+            batches (iterable): Minibatches laid out like `_sample_minibatch` returns them.
+            nb_updates (integer): Stop after this many updates. If `None`, train until `batches` runs out.
+            log_interval (integer): Number of updates between progress reports.
+
+        # Returns
+            A dict of the mean of each metric over every log interval.
+        """
+        if not self.compiled:
+            raise RuntimeError('Your tried to fit your agent but it hasn\'t been compiled yet. Please call `compile()` before `fit_offline()`.')
+
+        print("Training offline")
+        self.training = True
+        history = {}
+        interval_stats = {}
+        n_updates = 0
+        interval_start_time = time.time()
+        try:
+            for minibatch in batches:
+                metrics = self._train_on_minibatch(*minibatch)
+                n_updates += 1
+                if self.target_model_update >= 1 and n_updates % self.target_model_update == 0:
+                    self.update_target_model_hard()
+
+                for name, metric in zip(self.metrics_names, metrics):
+                    interval_stats.setdefault(name, RunningStat()).push(metric)
+
+                if n_updates % log_interval == 0:
+                    updates_per_second = log_interval / (time.time() - interval_start_time)
+                    print(str(n_updates) + " updates, " + str(round(updates_per_second, 1)) + " updates/sec, " +
+                          ", ".join(name + " " + str(round(stat.mean, 4)) for name, stat in interval_stats.items()))
+                    for name, stat in interval_stats.items():
+                        history.setdefault(name, []).append(stat.mean)
+                    interval_stats = {}
+                    interval_start_time = time.time()
+
+                if nb_updates is not None and n_updates >= nb_updates:
+                    break
+        except KeyboardInterrupt:
+            print("Offline training interrupted after " + str(n_updates) + " updates")
+        self.training = False
+
+        return history
+
     def forward(self, observation):
         # Select an action.
         state = self.memory.get_recent_state(observation)
         q_values = self.compute_q_values(state)
-        self.best_q = max(q_values)
-        if self.training:
-            action = self.policy.select_action(q_values=q_values)
+        action_mask = self.action_mask_fn() if self.action_mask_fn is not None else None
+        policy = self.policy if self.training else self.test_policy
+        if action_mask is None:
+            self.best_q = max(q_values)
+            action = policy.select_action(q_values=q_values)
         else:
-            action = self.test_policy.select_action(q_values=q_values)
+            self.best_q = np.max(q_values[action_mask])
+            action = policy.select_action(q_values=q_values, action_mask=action_mask)
 
         # Book-keeping.
         self.recent_observation = observation
         self.recent_action = action
+        self.recent_action_mask = action_mask
+
+        return action
+
+    def backward(self, reward, terminal):
+        if self.step % self.memory_interval == 0:
+            with self.memory_lock:
+                self.memory.append(self.recent_observation, self.recent_action, reward, terminal,
+                                   training=self.training, action_mask=self.recent_action_mask)
+                self._n_memory_appends += 1
+                if self.training:
+                    self._n_training_appends += 1
+
+        metrics = [np.nan for _ in self.metrics_names]
+        if not self.training:
+            return metrics
+
+        if self._learner is not None:
+            # Training happens on the learner thread; report how its latest update went
+            if self._learner.error is not None:
+                raise self._learner.error
+            # Only report an update once, so the episode's metric means aren't weighted by how long it sat between updates
+            n_updates = self._learner.n_updates
+            if n_updates == self._n_reported_updates or self._learner.metrics is None:
+                return metrics
+            self._n_reported_updates = n_updates
+            return self._learner.metrics
+
+        if self.step > self.nb_steps_warmup and self.step % self.train_interval == 0:
+            metrics = self._train_on_minibatch(*self._next_minibatch())
+
+        if self.target_model_update >= 1 and self.step % self.target_model_update == 0:
+            self.update_target_model_hard()
+
+        return metrics
+
+    def _start_learner(self):
+        if not self.async_learner:
+            return
+
+        if self._acting_model is None:
+            self._acting_model = clone_model(self.model, self.custom_model_objects)
+        self._sync_acting_model()
+
+        # The learner counts its updates from zero every fit, so the transitions it may learn from are counted from here too
+        self._learner_start_appends = self._n_training_appends
+        self._n_reported_updates = 0
+
+        def update_budget():
+            if self.memory.nb_entries < self.memory.window_length + 2:
+                return 0
+            return self.replay_ratio * max(self._n_training_appends - self._learner_start_appends - self.nb_steps_warmup, 0)
+
+        self._learner = AsyncLearner(self._learner_step, self._sync_acting_model, update_budget, sync_interval=self.acting_model_sync_interval)
+        self._learner.start()
+
+    def _stop_learner(self):
+        if self._learner is None:
+            return
+        self._learner.stop()
+        print("Learner did " + str(self._learner.n_updates) + " updates over " + str(self._n_training_appends - self._learner_start_appends) +
+              " transitions, syncing the acting model " + str(self._learner.n_syncs) + " times")
+        self._learner = None
+
+    def _sync_acting_model(self):
+        with self._trained_model_lock:
+            weights = self.model.get_weights()
+        with self._acting_model_lock:
+            self._acting_model.set_weights(weights)
+
+    def _learner_step(self):
+        minibatch = self._next_minibatch()
+        with self._trained_model_lock:
+            metrics = self._train_on_minibatch(*minibatch)
+            self._n_learner_updates += 1
+            if self.target_model_update >= 1 and self._n_learner_updates % self.target_model_update == 0:
+                self.update_target_model_hard()
+        return metrics
+
+    def _next_minibatch(self):
+        minibatch = self._prefetcher.get() if self._prefetcher is not None else None
+        if minibatch is None:
+            minibatch = self._sample_minibatch()
+        return minibatch
+
+    def _start_prefetcher(self):
+        # A processor decides what the state batches look like, so they can't be preallocated
+        if self.prefetch_depth <= 0 or self.processor is not None:
+            return
+
+        def can_sample():
+            return self.step > self.nb_steps_warmup and self.memory.nb_entries >= self.memory.window_length + 2
+
+        self._prefetcher = MinibatchPrefetcher(
+            self._sample_minibatch_into,
+            self._allocate_minibatch,
+            can_sample,
+            lambda: self._n_memory_appends,
+            depth=self.prefetch_depth,
+            # A batch normally waits depth training steps before it is used
+            max_staleness=(self.prefetch_depth + 1) * self.train_interval * self.memory_interval,
+        )
+        self._prefetcher.start()
+
+    def _stop_prefetcher(self):
+        if self._prefetcher is None:
+            return
+        self._prefetcher.stop()
+        print("Prefetched " + str(self._prefetcher.n_prefetched) + " minibatches, missed " +
+              str(self._prefetcher.n_missed) + ", threw away " + str(self._prefetcher.n_stale) + " stale ones")
+        self._prefetcher = None
+
+    def _allocate_minibatch(self):
+        with self.memory_lock:
+            # keras-rl's RingBuffer doesn't take negative indexes
+            observation = np.asarray(self.memory.observations[self.memory.nb_entries - 1])
+        state_shape = (self.batch_size, self.memory.window_length) + observation.shape
+        return (
+            np.zeros(state_shape, dtype=observation.dtype),
+            np.zeros(self.batch_size, dtype=np.int64),
+            np.zeros(self.batch_size, dtype=np.float32),
+            np.zeros(state_shape, dtype=observation.dtype),
+            np.zeros(self.batch_size, dtype=np.float32),
+            np.ones((self.batch_size, self.nb_actions), dtype=bool),
+        )
+
+    def _sample_minibatch_into(self, minibatch):
+        """
+        Same as _sample_minibatch, but fills in arrays from _allocate_minibatch instead of making new ones.
+        """
+        with self.memory_lock:
+            experiences, next_action_masks = self.memory.sample_with_action_masks(self.batch_size, self.nb_actions)
+
+        state0_batch, action_batch, reward_batch, state1_batch, terminal1_batch, next_action_mask_batch = minibatch
+        for i, e in enumerate(experiences):
+            for j in range(len(e.state0)):
+                state0_batch[i, j] = e.state0[j]
+                state1_batch[i, j] = e.state1[j]
+            action_batch[i] = e.action
+            reward_batch[i] = e.reward
+            terminal1_batch[i] = 0. if e.terminal1 else 1.
+        np.copyto(next_action_mask_batch, next_action_masks)
+
+    def _sample_minibatch(self):
+        """
+        Samples a batch from memory and turns it into arrays:
+        (state0, actions, rewards, state1, terminal1, next_action_masks).
+        terminal1 is 0 where the episode ended after the action, and 1 otherwise.
+        """
+        with self.memory_lock:
+            experiences, next_action_masks = self.memory.sample_with_action_masks(self.batch_size, self.nb_actions)
+
+        state0_batch = self.process_state_batch([e.state0 for e in experiences])
+        state1_batch = self.process_state_batch([e.state1 for e in experiences])
+        action_batch = np.array([e.action for e in experiences], dtype=np.int64)
+        reward_batch = np.array([e.reward for e in experiences], dtype=np.float32)
+        terminal1_batch = np.array([0. if e.terminal1 else 1. for e in experiences], dtype=np.float32)
+        return state0_batch, action_batch, reward_batch, state1_batch, terminal1_batch, next_action_masks
+
+    def _train_on_minibatch(self, state0_batch, action_batch, reward_batch, state1_batch, terminal1_batch, next_action_masks):
+        # Same update as keras-rl, but the next state's value only looks at actions that were legal there
+        target_q_values = self.target_model.predict_on_batch(state1_batch)
+        batch_range = np.arange(len(action_batch))
+        if self.enable_double_dqn:
+            # The online network picks the next action, the target network values it
+            q_values = self.model.predict_on_batch(state1_batch)
+            next_actions = np.argmax(np.where(next_action_masks, q_values, -np.inf), axis=1)
+            q_batch = target_q_values[batch_range, next_actions]
+        else:
+            q_batch = np.max(np.where(next_action_masks, target_q_values, -np.inf), axis=1)
+
+        Rs = reward_batch + self.gamma * q_batch * terminal1_batch
+
+        targets = np.zeros((len(action_batch), self.nb_actions), dtype=np.float32)
+        masks = np.zeros((len(action_batch), self.nb_actions), dtype=np.float32)
+        targets[batch_range, action_batch] = Rs
+        masks[batch_range, action_batch] = 1.
+        dummy_targets = Rs.astype(np.float32)
 
-        return action
\ No newline at end of file
+        ins = [state0_batch] if type(self.model.input) is not list else state0_batch
+        metrics = self.trainable_model.train_on_batch(ins + [targets, masks], [dummy_targets, targets])
+        # Leave out the dummy loss and the individual losses of the two outputs
+        metrics = [metric for idx, metric in enumerate(metrics) if idx not in (1, 2)]
+        metrics += self.policy.metrics
+        if self.processor is not None:
+            metrics += self.processor.metrics
+        return metrics
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import asyncio
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+
+import numpy as np
+
+from typing import Any, Callable, List
+
+class InferenceBatcher():
+    """
+    Gathers Q-value requests from many battles and runs them through the model together.
+    A batch is computed as soon as max_batch_size states are waiting, or max_delay_ms after the
+    first of them arrived, whichever comes first.
+    Requests can come from any thread (compute) or from an asyncio event loop (compute_async),
+    so the same batcher can serve several players with many concurrent battles each.
+    It is only used by ModelPlayer, for ladder and evaluation battles: training plays one battle at a time.
+    """
+    def __init__(self, predict_batch : Callable[[List[Any]], np.ndarray], max_batch_size : int = 16, max_delay_ms : float = 2.0):
+        """
+        :param predict_batch: Computes the Q-values of a list of states, such as DQNAgent.compute_batch_q_values.
+        :param max_batch_size: Largest number of states computed at once.
+        :param max_delay_ms: Longest time the first state of a batch waits for the batch to fill up.
+        """
+        self._predict_batch = predict_batch
+        self._max_batch_size = max(max_batch_size, 1)
+        self._max_delay = max_delay_ms / 1000.0
+
+        self._requests = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.n_batches = 0
+        self.n_states = 0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.n_states / self.n_batches if self.n_batches > 0 else 0.0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                return
+            self._requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, state : Any) -> Future:
+        self.start()
+        future = Future()
+        self._requests.put((state, future))
+        return future
+
+    def compute(self, state : Any) -> np.ndarray:
+        """
+        Blocks until the Q-values of state have been computed.
+        """
+        return self.submit(state).result()
+
+    async def compute_async(self, state : Any) -> np.ndarray:
+        """
+        Waits for the Q-values of state without blocking the event loop, so other battles keep going.
+        """
+        return await asyncio.wrap_future(self.submit(state))
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            request = self._requests.get()
+            if request is None:
+                break
+
+            batch = [request]
+            deadline = time.perf_counter() + self._max_delay
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+
+            self._compute_batch(batch)
+
+    def _compute_batch(self, batch) -> None:
+        try:
+            q_values = self._predict_batch([state for state, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.n_batches += 1
+        self.n_states += len(batch)
+        for (_, future), row in zip(batch, q_values):
+            future.set_result(np.asarray(row).flatten())
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+from collections import deque
+
+import numpy as np
+
+from rl.memory import SequentialMemory, sample_batch_indexes
+
+class MaskedSequentialMemory(SequentialMemory):
+    """
+    Replay memory that also keeps the legal-action mask of every observation,
+    so that the Q-learning target only maximises over actions that were legal in the next state.
+    """
+    def __init__(self, limit, **kwargs):
+        super(MaskedSequentialMemory, self).__init__(limit, **kwargs)
+        # Kept the same way as the memory's other buffers, so the indexes line up
+        self.action_masks = deque(maxlen=limit)
+
+    def append(self, observation, action, reward, terminal, training=True, action_mask=None):
+        super(MaskedSequentialMemory, self).append(observation, action, reward, terminal, training=training)
+        if training:
+            self.action_masks.append(action_mask)
+
+    def sample_with_action_masks(self, batch_size, nb_actions):
+        """
+        Returns a batch of experiences, and the legal-action masks of their next states.
+        Transitions stored without a mask count every action as legal.
+        """
+        # SequentialMemory.sample swaps out transitions that start an episode for other random ones,
+        # which would leave us not knowing which masks go with the batch. Drawing the indexes here,
+        # and skipping those transitions ourselves, means sample uses exactly these indexes.
+        batch_idxs = list(sample_batch_indexes(self.window_length, self.nb_entries - 1, size=batch_size))
+        for i in range(batch_size):
+            while self.terminals[batch_idxs[i] - 1]:
+                batch_idxs[i] = sample_batch_indexes(self.window_length, self.nb_entries - 1, size=1)[0]
+
+        experiences = self.sample(batch_size, batch_idxs)
+
+        # sample() shifts the indexes by one; the next state ends on the observation at index + 1
+        next_action_masks = np.ones((batch_size, nb_actions), dtype=bool)
+        for i, idx in enumerate(batch_idxs):
+            action_mask = self.action_masks[idx + 1]
+            if action_mask is not None:
+                next_action_masks[i] = action_mask
+        return experiences, next_action_masks
+
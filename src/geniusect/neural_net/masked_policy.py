@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from rl.policy import EpsGreedyQPolicy, GreedyQPolicy
+
+def masked_argmax(q_values : np.ndarray, action_mask : np.ndarray) -> int:
+    return int(np.argmax(np.where(action_mask, q_values, -np.inf)))
+
+class MaskedEpsGreedyQPolicy(EpsGreedyQPolicy):
+    """
+    Epsilon-greedy policy that only ever picks actions that are legal this turn,
+    both when exploring and when exploiting.
+    """
+    def select_action(self, q_values, action_mask=None):
+        if action_mask is None:
+            return super(MaskedEpsGreedyQPolicy, self).select_action(q_values)
+
+        if np.random.uniform() < self.eps:
+            return int(np.random.choice(np.flatnonzero(action_mask)))
+        return masked_argmax(q_values, action_mask)
+
+class MaskedGreedyQPolicy(GreedyQPolicy):
+    """
+    Greedy policy that picks the legal action with the highest Q-value.
+    """
+    def select_action(self, q_values, action_mask=None):
+        if action_mask is None:
+            return super(MaskedGreedyQPolicy, self).select_action(q_values)
+        return masked_argmax(q_values, action_mask)
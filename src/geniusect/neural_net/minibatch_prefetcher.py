@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+
+import numpy as np
+
+from typing import Callable, Optional, Tuple
+
+class MinibatchPrefetcher():
+    """
+    Samples replay minibatches on a background thread, so that a training step starts from a batch
+    that is already assembled instead of sampling and stacking one after env.step returns.
+    Batches are written into a small pool of preallocated arrays. The arrays of a batch are handed back
+    to the pool when the next batch is taken, so they must not be kept past the training step.
+    """
+    def __init__(self, sample_into : Callable[[Tuple[np.ndarray, ...]], None], allocate : Callable[[], Tuple[np.ndarray, ...]],
+                 can_sample : Callable[[], bool], memory_version : Callable[[], int], depth : int = 2, max_staleness : int = 8):
+        """
+        :param sample_into: Samples a minibatch into the given arrays.
+        :param allocate: Allocates the arrays of one minibatch.
+        :param can_sample: Whether the memory holds enough transitions to sample from yet.
+        :param memory_version: How many transitions have been added to the memory so far.
+        :param depth: How many batches to keep ready.
+        :param max_staleness: Batches sampled more than this many transitions ago are thrown away,
+        so training keeps up with what was just added to the memory.
+        """
+        self._sample_into = sample_into
+        self._allocate = allocate
+        self._can_sample = can_sample
+        self._memory_version = memory_version
+        self._max_staleness = max_staleness
+
+        # One more slot than the queue holds, for the batch that is being trained on
+        depth = max(depth, 1)
+        self._slots = [None] * (depth + 1)
+        self._free_slots = queue.Queue()
+        for slot in range(len(self._slots)):
+            self._free_slots.put(slot)
+        self._ready = queue.Queue()
+        self._taken_slot = None
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.n_prefetched = 0
+        self.n_missed = 0
+        self.n_stale = 0
+        self.error = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def get(self) -> Optional[Tuple[np.ndarray, ...]]:
+        """
+        Returns the next ready minibatch, or None if there isn't a fresh one yet.
+        Raises whatever stopped the background thread, if it died.
+        """
+        if self.error is not None:
+            raise self.error
+
+        if self._taken_slot is not None:
+            self._free_slots.put(self._taken_slot)
+            self._taken_slot = None
+
+        version = self._memory_version()
+        while True:
+            try:
+                slot, batch_version = self._ready.get_nowait()
+            except queue.Empty:
+                self.n_missed += 1
+                return None
+
+            if version - batch_version <= self._max_staleness:
+                self.n_prefetched += 1
+                self._taken_slot = slot
+                return self._slots[slot]
+
+            self.n_stale += 1
+            self._free_slots.put(slot)
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                slot = self._free_slots.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if not self._can_sample():
+                self._free_slots.put(slot)
+                self._stop_event.wait(0.01)
+                continue
+
+            try:
+                if self._slots[slot] is None:
+                    self._slots[slot] = self._allocate()
+                version = self._memory_version()
+                self._sample_into(self._slots[slot])
+            except Exception as e:
+                # Raised again on the training thread, the next time it asks for a batch
+                self.error = e
+                self._free_slots.put(slot)
+                return
+
+            self._ready.put((slot, version))
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import math
+
+class RunningStat():
+    """
+    Count, mean, variance, min and max of a stream of values, updated in constant time with Welford's algorithm.
+    NaNs (such as the metrics of steps that didn't train) are skipped, like np.nanmean does.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = math.nan
+        self.min = math.nan
+        self.max = math.nan
+        self._m2 = 0.0
+
+    def push(self, value : float) -> None:
+        value = float(value)
+        if math.isnan(value):
+            return
+
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            self.min = value
+            self.max = value
+            return
+
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / self.count if self.count > 0 else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
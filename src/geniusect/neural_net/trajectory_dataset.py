@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+
+import numpy as np
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.geniusect.neural_net.trajectory_recorder import load_shard, read_index
+
+class TrajectoryDataset():
+    """
+    Streams shuffled training minibatches out of the shards a TrajectoryRecorder wrote.
+    shuffle_shards shards are loaded at a time and their transitions shuffled together, so memory use
+    stays bounded however much has been recorded. Batches are assembled on a background thread and
+    queued prefetch deep, in the same layout as DQNAgent._sample_minibatch:
+    (state0, actions, rewards, state1, terminal1, next_action_masks).
+    """
+    def __init__(self, directory : str, window_length : int, batch_size : int = 32, shuffle_shards : int = 4, prefetch : int = 8, seed : Optional[int] = None):
+        self.directory = directory
+        self._entries = read_index(directory)
+        self._window_length = window_length
+        self._batch_size = batch_size
+        self._shuffle_shards = max(shuffle_shards, 1)
+        self._prefetch = max(prefetch, 1)
+        self._rng = np.random.RandomState(seed)
+
+    @property
+    def n_shards(self) -> int:
+        return len(self._entries)
+
+    @property
+    def n_steps(self) -> int:
+        return sum(entry["steps"] for entry in self._entries)
+
+    def shapes(self) -> Tuple[int, int]:
+        """
+        Size of one observation, and number of actions.
+        """
+        shard = load_shard(self.directory, self._entries[0])
+        return shard["observations"].shape[1], shard["action_masks"].shape[1]
+
+    def batches(self, epochs : int = 1) -> Iterator[Tuple[np.ndarray, ...]]:
+        batch_queue = queue.Queue(maxsize=self._prefetch)
+        stop_event = threading.Event()
+
+        def produce():
+            try:
+                for batch in self._generate(epochs):
+                    while not stop_event.is_set():
+                        try:
+                            batch_queue.put(batch, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop_event.is_set():
+                        return
+                batch_queue.put(None)
+            except Exception as e:
+                batch_queue.put(e)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batch_queue.get()
+                if batch is None:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop_event.set()
+            thread.join()
+
+    def _generate(self, epochs : int) -> Iterator[Tuple[np.ndarray, ...]]:
+        for _ in range(epochs):
+            order = self._rng.permutation(len(self._entries))
+            for group_start in range(0, len(order), self._shuffle_shards):
+                group = [self._entries[i] for i in order[group_start:group_start + self._shuffle_shards]]
+                yield from self._group_batches([load_shard(self.directory, entry) for entry in group])
+
+    def _group_batches(self, shards : List[Dict[str, np.ndarray]]) -> Iterator[Tuple[np.ndarray, ...]]:
+        observations = np.concatenate([shard["observations"] for shard in shards])
+        actions = np.concatenate([shard["actions"] for shard in shards]).astype(np.int64)
+        rewards = np.concatenate([shard["rewards"] for shard in shards])
+        dones = np.concatenate([shard["dones"] for shard in shards])
+        action_masks = np.concatenate([shard["action_masks"] for shard in shards])
+        lengths = np.concatenate([shard["episode_lengths"] for shard in shards])
+
+        # Where each step's episode starts and ends
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        ends = starts + np.repeat(lengths, lengths)
+
+        # The last step of an episode that was cut short has nothing to bootstrap from
+        steps = np.arange(len(actions))
+        steps = steps[(steps + 1 < ends) | dones]
+        self._rng.shuffle(steps)
+
+        window_offsets = np.arange(1 - self._window_length, 1)
+        for batch_start in range(0, len(steps) - self._batch_size + 1, self._batch_size):
+            batch = steps[batch_start:batch_start + self._batch_size]
+            batch_starts = starts[batch][:, None]
+            batch_ends = ends[batch][:, None]
+
+            # Observations from before the episode started are zeroed, like keras-rl's memory does
+            state0_indexes = batch[:, None] + window_offsets
+            state0_valid = state0_indexes >= batch_starts
+            state0 = observations[np.clip(state0_indexes, 0, len(observations) - 1)] * state0_valid[..., None]
+
+            state1_indexes = state0_indexes + 1
+            state1_valid = (state1_indexes >= batch_starts) & (state1_indexes < batch_ends)
+            state1 = observations[np.clip(state1_indexes, 0, len(observations) - 1)] * state1_valid[..., None]
+
+            terminal1 = np.where(dones[batch], 0., 1.).astype(np.float32)
+            next_action_masks = action_masks[np.minimum(batch + 1, len(action_masks) - 1)]
+            # Nothing is picked after the last step, so every action counts as legal there
+            next_action_masks[dones[batch]] = True
+
+            yield state0, actions[batch], rewards[batch], state1, terminal1, next_action_masks
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from rl.callbacks import Callback
+
+from typing import Any, Dict, List
+
+INDEX_FILE = "index.jsonl"
+
+class TrajectoryRecorder(Callback):
+    """
+    Records every step the agent trains on, so battles can be trained on again later without a server.
+    Steps are gathered per episode; finished episodes are handed to a writer thread, which packs them
+    into compressed .npz shards of about shard_mb megabytes and lists each shard in an index file.
+    The step loop never waits on the disk: if more than max_queued_episodes are waiting to be written,
+    new episodes are dropped instead.
+    """
+    def __init__(self, directory : str, nb_actions : int, shard_mb : float = 64.0, max_queued_episodes : int = 64):
+        super(TrajectoryRecorder, self).__init__()
+        self.directory = directory
+        self._nb_actions = nb_actions
+        self._shard_bytes = shard_mb * 1024 * 1024
+
+        self._episodes = queue.Queue(maxsize=max(max_queued_episodes, 1))
+        self._thread = None
+        self._episode_steps = []
+        self._shard_count = 0
+
+        self.n_recorded = 0
+        self.n_dropped = 0
+        # Whatever stopped the writer thread, if it died
+        self.error = None
+
+    def on_train_begin(self, logs={}):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._thread is None:
+            self.error = None
+            self._thread = threading.Thread(target=self._write_shards, daemon=True)
+            self._thread.start()
+
+    def on_step_end(self, step, logs={}):
+        action_mask = logs.get("action_mask")
+        if action_mask is None:
+            action_mask = np.ones(self._nb_actions, dtype=bool)
+        # previous_observation is the one the action was taken on; observation is the one it led to
+        self._episode_steps.append((
+            np.asarray(logs["previous_observation"], dtype=np.float32),
+            logs["action"],
+            logs["reward"],
+            logs["done"],
+            action_mask,
+            logs.get("battle_tag") or ""
+        ))
+
+    def on_episode_end(self, episode, logs={}):
+        self._queue_episode()
+
+    def on_train_end(self, logs={}):
+        # Keep whatever there is of an unfinished episode; it just doesn't end in a terminal step
+        self._queue_episode()
+        if self._thread is not None:
+            # Waits for the last shard to be written, unless the writer died and the queue will never empty
+            while self._thread.is_alive():
+                try:
+                    self._episodes.put(None, timeout=1.0)
+                    break
+                except queue.Full:
+                    continue
+            self._thread.join()
+            self._thread = None
+
+    def _queue_episode(self) -> None:
+        if len(self._episode_steps) == 0:
+            return
+
+        steps = self._episode_steps
+        self._episode_steps = []
+        try:
+            self._episodes.put_nowait(steps)
+            self.n_recorded += 1
+        except queue.Full:
+            self.n_dropped += 1
+            if self.n_dropped == 1 or self.n_dropped % 100 == 0:
+                print("Trajectory writer is falling behind; dropped " + str(self.n_dropped) + " episodes so far")
+
+    def _write_shards(self) -> None:
+        shard = []
+        shard_bytes = 0
+        try:
+            while True:
+                steps = self._episodes.get()
+                if steps is None:
+                    break
+
+                shard.append(steps)
+                shard_bytes += sum(step[0].nbytes for step in steps)
+                if shard_bytes >= self._shard_bytes:
+                    self._write_shard(shard)
+                    shard = []
+                    shard_bytes = 0
+
+            if len(shard) > 0:
+                self._write_shard(shard)
+        except Exception as e:
+            # Training carries on without recording; new episodes are dropped once the queue fills up
+            self.error = e
+            print("Trajectory writer stopped: " + repr(e))
+
+    def _write_shard(self, episodes : List[list]) -> None:
+        self._shard_count += 1
+        write_shard(self.directory, episodes, self._shard_count)
+
+def write_shard(directory : str, episodes : List[list], shard_number : int) -> Dict[str, Any]:
+    """
+    Writes episodes to a new shard in directory, and adds it to the index.
+    Each episode is a list of (observation, action, reward, done, action mask, battle tag) steps.
+    """
+    steps = [step for episode in episodes for step in episode]
+    battle_tags = [episode[0][5] for episode in episodes]
+
+    file_name = time.strftime("%Y%m%d-%H%M%S") + "-" + str(os.getpid()) + "-" + str(shard_number).zfill(5) + ".npz"
+    path = os.path.join(directory, file_name)
+
+    # Written under another name first, so a reader never sees half a shard
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as shard_file:
+        np.savez_compressed(
+            shard_file,
+            observations=np.stack([step[0] for step in steps]).astype(np.float32),
+            actions=np.array([step[1] for step in steps], dtype=np.int16),
+            rewards=np.array([step[2] for step in steps], dtype=np.float32),
+            dones=np.array([step[3] for step in steps], dtype=bool),
+            action_masks=np.stack([step[4] for step in steps]).astype(bool),
+            episode_lengths=np.array([len(episode) for episode in episodes], dtype=np.int32),
+            battle_tags=np.array(battle_tags)
+        )
+    os.replace(temp_path, path)
+
+    entry = {
+        "file": file_name,
+        "time": time.time(),
+        "episodes": len(episodes),
+        "steps": len(steps),
+        "bytes": os.path.getsize(path)
+    }
+    with open(os.path.join(directory, INDEX_FILE), "a") as index_file:
+        index_file.write(json.dumps(entry) + "\n")
+    return entry
+
+def read_index(directory : str) -> List[Dict[str, Any]]:
+    """
+    The shards recorded in directory, oldest first.
+    """
+    entries = []
+    try:
+        with open(os.path.join(directory, INDEX_FILE), "r") as index_file:
+            for line in index_file:
+                line = line.strip()
+                if line == "":
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A run that died mid-write can leave a partial last line
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+def load_shard(directory : str, entry : Dict[str, Any]) -> Dict[str, np.ndarray]:
+    with np.load(os.path.join(directory, entry["file"])) as shard:
+        return {name: shard[name] for name in shard.files}
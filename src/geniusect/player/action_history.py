@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+class ActionHistory():
+    """
+    Fixed-size history of the actions taken in one battle, most recent first.
+    Every action is written twice, size elements apart, so the history is always one contiguous
+    slice of the buffer: adding an action and reading the history never allocate or copy.
+    """
+    def __init__(self, size : int, fill_value : float = -1.0):
+        self._size = size
+        self._buffer = np.full(2 * size, fill_value, dtype=np.float64)
+        # Where the most recent action is; moves backwards through the buffer
+        self._head = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return min(self._count, self._size)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def push(self, value : float) -> None:
+        self._head = (self._head - 1) % self._size
+        self._buffer[self._head] = value
+        self._buffer[self._head + self._size] = value
+        self._count += 1
+
+    def view(self) -> np.ndarray:
+        """
+        Read-only view of the history, most recent action first, padded with fill_value.
+        It changes as actions are pushed, so copy it if it has to outlive the next push.
+        """
+        view = self._buffer[self._head:self._head + self._size]
+        view.flags.writeable = False
+        return view
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from poke_env.environment.battle import Battle
+
+from typing import Optional
+
+class RollingWinRate():
+    """
+    Win rate over the last window battles, kept in a ring buffer so that adding a result is O(1).
+    """
+    def __init__(self, window : int):
+        self._results = np.zeros(window, dtype=np.int8)
+        self._next = 0
+        self._count = 0
+        self._n_won = 0
+
+    def add(self, won : bool) -> None:
+        if self._count == len(self._results):
+            self._n_won -= int(self._results[self._next])
+        else:
+            self._count += 1
+        self._results[self._next] = 1 if won else 0
+        self._n_won += 1 if won else 0
+        self._next = (self._next + 1) % len(self._results)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def win_rate(self) -> float:
+        return self._n_won / self._count if self._count > 0 else 0.0
+
+class BattleCounts():
+    """
+    Battles won, lost and finished, and the win rate over the last few of them.
+    """
+    def __init__(self, window : int):
+        self.won = 0
+        self.lost = 0
+        self.finished = 0
+        self.rolling = RollingWinRate(window)
+
+    def add(self, won : Optional[bool], lost : Optional[bool]) -> None:
+        self.finished += 1
+        if won:
+            self.won += 1
+        elif lost:
+            self.lost += 1
+        self.rolling.add(bool(won))
+
+    @property
+    def tied(self) -> int:
+        return self.finished - self.won - self.lost
+
+    @property
+    def win_rate(self) -> float:
+        return self.won / self.finished if self.finished > 0 else 0.0
+
+class BattleCounters():
+    """
+    BattleCounts over every battle, by opponent and by battle format.
+    """
+    def __init__(self, window : int = 100):
+        self.window = window
+        self.reset()
+
+    def reset(self) -> None:
+        self.total = BattleCounts(self.window)
+        self.by_opponent = {}
+        self.by_format = {}
+
+    def record(self, battle_format : str, opponent : str, won : Optional[bool], lost : Optional[bool]) -> None:
+        self.total.add(won, lost)
+        for counts, key in ((self.by_opponent, opponent), (self.by_format, battle_format)):
+            if key not in counts:
+                counts[key] = BattleCounts(self.window)
+            counts[key].add(won, lost)
+
+class BattleCountersMixin():
+    """
+    poke-env works out n_won_battles, n_lost_battles, n_finished_battles and win_rate by going over every
+    battle it has kept, which gets slower the more battles are played. This counts battles as they finish instead,
+    by opponent and by format as well, and keeps a rolling win rate over the last few battles.
+    Mix in ahead of the poke-env player class, and of BattleRetentionMixin, which relies on these counts.
+    """
+    _battle_counters = None
+
+    def enable_battle_counters(self, window : int) -> None:
+        self._battle_counters = BattleCounters(window)
+
+    @property
+    def battle_counters(self) -> Optional[BattleCounters]:
+        return self._battle_counters
+
+    @property
+    def n_finished_battles(self) -> int:
+        if self._battle_counters is None:
+            return super(BattleCountersMixin, self).n_finished_battles
+        return self._battle_counters.total.finished
+
+    @property
+    def n_won_battles(self) -> int:
+        if self._battle_counters is None:
+            return super(BattleCountersMixin, self).n_won_battles
+        return self._battle_counters.total.won
+
+    @property
+    def n_lost_battles(self) -> int:
+        if self._battle_counters is None:
+            return super(BattleCountersMixin, self).n_lost_battles
+        return self._battle_counters.total.lost
+
+    @property
+    def win_rate(self) -> float:
+        return self.n_won_battles / self.n_finished_battles
+
+    @property
+    def rolling_win_rate(self) -> float:
+        if self._battle_counters is None:
+            return self.win_rate
+        return self._battle_counters.total.rolling.win_rate
+
+    def reset_battles(self) -> None:
+        super(BattleCountersMixin, self).reset_battles()
+        if self._battle_counters is not None:
+            self._battle_counters.reset()
+
+    async def _battle_finished_callback(self, battle : Battle) -> None:
+        # Counted first, so that the counts are right by the time anything waiting on this battle looks at them
+        if self._battle_counters is not None:
+            self._battle_counters.record(battle.battle_tag.split("-")[1], battle.opponent_username or "", battle.won, battle.lost)
+        await super(BattleCountersMixin, self)._battle_finished_callback(battle)
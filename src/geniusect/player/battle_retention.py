@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import time
+
+from collections import deque
+
+from poke_env.environment.battle import Battle
+
+from typing import Dict, NamedTuple, Optional
+
+class BattleSummary(NamedTuple):
+    """
+    What is left of a finished battle once the Battle itself has been let go of.
+    """
+    battle_tag : str
+    won : Optional[bool]
+    turns : int
+    rating : Optional[int]
+    final_reward : Optional[float]
+
+class BattleRetentionMixin():
+    """
+    poke-env keeps every Battle a player has played, with its full teams and history, until reset_battles.
+    Over a long run that adds up, so this swaps finished battles for a BattleSummary once more than
+    max_finished_battles have finished since, or once they have been finished for max_age seconds.
+    Mix in behind BattleCountersMixin, so that the battles that were let go of are still counted.
+    """
+    _max_finished_battles = None
+    _max_finished_battle_age = None
+
+    def set_battle_retention(self, max_finished_battles : Optional[int], max_age : Optional[float] = None) -> None:
+        """
+        :param max_finished_battles: How many finished battles to keep whole. None keeps all of them.
+            The battle that just finished is always kept, so that its final observation can still be read.
+        :param max_age: Seconds after which a finished battle is let go of. None keeps them regardless of age.
+        """
+        self._max_finished_battles = max(max_finished_battles, 1) if max_finished_battles is not None else None
+        self._max_finished_battle_age = max_age
+        if not hasattr(self, "_battle_summaries"):
+            self._reset_battle_summaries()
+
+    def _reset_battle_summaries(self) -> None:
+        # (battle tag, time it finished) of the finished battles we still keep, oldest first
+        self._finished_battle_times = deque()
+        self._battle_summaries = {}
+
+    @property
+    def battle_summaries(self) -> Dict[str, BattleSummary]:
+        return getattr(self, "_battle_summaries", {})
+
+    def reset_battles(self) -> None:
+        super(BattleRetentionMixin, self).reset_battles()
+        if hasattr(self, "_battle_summaries"):
+            self._reset_battle_summaries()
+
+    async def _handle_battle_message(self, message : str) -> None:
+        # poke-env would wait forever for a battle it no longer has, so late messages to one we let go of are dropped
+        if len(self.battle_summaries) > 0 and message.split("\n", 1)[0][1:].strip() in self._battle_summaries:
+            return
+        await super(BattleRetentionMixin, self)._handle_battle_message(message)
+
+    async def _battle_finished_callback(self, battle : Battle) -> None:
+        await super(BattleRetentionMixin, self)._battle_finished_callback(battle)
+        if self._max_finished_battles is None and self._max_finished_battle_age is None:
+            return
+
+        now = time.time()
+        self._finished_battle_times.append((battle.battle_tag, now))
+        while len(self._finished_battle_times) > 1:
+            battle_tag, finish_time = self._finished_battle_times[0]
+            too_many = self._max_finished_battles is not None and len(self._finished_battle_times) > self._max_finished_battles
+            too_old = self._max_finished_battle_age is not None and now - finish_time > self._max_finished_battle_age
+            if not too_many and not too_old:
+                break
+            self._finished_battle_times.popleft()
+            self._summarize_battle(battle_tag)
+
+    def _summarize_battle(self, battle_tag : str) -> None:
+        battle = self._battles.pop(battle_tag, None)
+        if battle is None:
+            # Already gone with reset_battles
+            return
+
+        self._battle_summaries[battle_tag] = BattleSummary(battle_tag, battle.won, battle.turn, battle.rating, self._final_reward(battle))
+        self._forget_battle(battle)
+
+    def _final_reward(self, battle : Battle) -> Optional[float]:
+        """
+        The reward the battle ended on, for players that compute one.
+        """
+        return None
+
+    def _forget_battle(self, battle : Battle) -> None:
+        """
+        Called once a finished battle has been summarized, to let go of anything else kept about it.
+        """
+        pass
@@ -48,7 +48,9 @@ class DefaultPlayer(RandomPlayer):
         super(DefaultPlayer, self).__init__(
             player_configuration=player_configuration,
             avatar=269,
+            battle_format=battle_format,
             log_level=log_level,
+            max_concurrent_battles=max_concurrent_battles,
             server_configuration=server_configuration,
             start_listening=start_listening,
         )
@@ -2,8 +2,9 @@
 
 import random
 
+import numpy as np
+
 from poke_env.environment.battle import Battle
-from poke_env.environment.move_category import MoveCategory
 from poke_env.player.random_player import RandomPlayer
 from poke_env.player_configuration import PlayerConfiguration
 from poke_env.server_configuration import ServerConfiguration
@@ -11,9 +12,12 @@ from poke_env.teambuilder.teambuilder import Teambuilder
 
 import src.geniusect.config as config
 
+from src.geniusect.damage_calculator import get_damage_calculator
+from src.geniusect.player.outbound_queue import OutboundQueueMixin
+
 from typing import Any, Callable, List, Optional, Tuple, Union, Set
 
-class MaxDamagePlayer(RandomPlayer):
+class MaxDamagePlayer(OutboundQueueMixin, RandomPlayer):
     def __init__(
         self,
         player_configuration: Optional[PlayerConfiguration] = None,
@@ -54,16 +58,20 @@ class MaxDamagePlayer(RandomPlayer):
         super(MaxDamagePlayer, self).__init__(
             player_configuration=player_configuration,
             avatar=58,
+            battle_format=battle_format,
             log_level=log_level,
+            max_concurrent_battles=max_concurrent_battles,
             server_configuration=server_configuration,
             start_listening=start_listening,
         )
 
         self._tryhard_percent = config.get_starting_tryhard()
         self._tryhard_floor = config.get_tryhard_floor()
+        self._damage_calculator = get_damage_calculator()
+        self.enable_outbound_queue(config.build_outbound_rate_limiter(self._server_url), config.get_chat_reserve())
     
     async def _battle_started_callback(self, battle : Battle) -> None:
-        await self._send_message("Tryhard percent: " + str(self._tryhard_percent), battle.battle_tag)
+        self._queue_chat("Tryhard percent: " + str(self._tryhard_percent), battle.battle_tag)
 
     async def _battle_finished_callback(self, battle: Battle) -> None:
         if battle.won:
@@ -77,46 +85,20 @@ class MaxDamagePlayer(RandomPlayer):
         # If the player can attack, it will
         random_num = random.random()
         if battle.available_moves and random_num < self._tryhard_percent:
-            our_pokemon = battle.active_pokemon
-            boosts = our_pokemon.boosts
-
-            opponent_pkm = battle.opponent_active_pokemon
-            
-            best_power = -1
-            best_move = battle.available_moves[0]
-            for move in battle.available_moves:
-                move_category = move.category
-
-                if move_category == MoveCategory.PHYSICAL:
-                    current_boosts = boosts["atk"]
-                elif move_category == MoveCategory.SPECIAL:
-                    current_boosts = boosts["spa"]
-                else:
-                    current_boosts = 0
-
-                if current_boosts >= 0:
-                    current_boosts = (current_boosts + 2) / 2
-                else:
-                    current_boosts = 2 / ((-current_boosts) + 2)
-
-                dmg_multiplier = 1
-                stab = 1
-                if move.type:
-                    dmg_multiplier = move.type.damage_multiplier(
-                        opponent_pkm.type_1,
-                        opponent_pkm.type_2,
-                    )
-                    if move.type == our_pokemon.type_1 or move.type == our_pokemon.type_2:
-                        stab = 1.5
-                
-                scaled_power = dmg_multiplier * move.base_power * current_boosts * move.accuracy * stab
-                if scaled_power > best_power:
-                    best_power = scaled_power
-                    best_move = move
+            # Expected damage of each move, as a fraction of the opponent's HP
+            expected_damage = self._damage_calculator.expected_damage(
+                battle.active_pokemon,
+                battle.available_moves,
+                [battle.opponent_active_pokemon],
+                weather=battle.weather,
+                defender_side_conditions=battle.opponent_side_conditions
+            )[:, 0]
+            best_move = int(np.argmax(expected_damage))
 
-            if best_power > 30:
+            # About what a neutral 30 base power move does
+            if expected_damage[best_move] > 0.1:
                 # Finds the best move among available ones
-                return self.create_order(best_move)
+                return self.create_order(battle.available_moves[best_move])
         
         return self.choose_random_move(battle)
 			
\ No newline at end of file
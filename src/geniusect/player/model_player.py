@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+from collections import deque
+
+import numpy as np
+
+from poke_env.environment.battle import Battle
+from poke_env.player.player import Player
+from poke_env.player_configuration import PlayerConfiguration
+from poke_env.server_configuration import ServerConfiguration
+
+import src.geniusect.config as config
+
+from src.geniusect.neural_net.inference_batcher import InferenceBatcher
+from src.geniusect.player.battle_counters import BattleCountersMixin
+from src.geniusect.player.battle_retention import BattleRetentionMixin
+from src.geniusect.player.outbound_queue import OutboundQueueMixin
+
+from typing import Any, Callable, List, Optional, Tuple, Union, Set
+
+class ModelPlayer(BattleCountersMixin, BattleRetentionMixin, OutboundQueueMixin, Player):
+    """
+    Plays battles greedily with the Q-network of an RLPlayer, without going through the gym environment.
+    Since it does not need to hand observations back to a training loop, it can play many battles at once.
+    """
+    def __init__(
+        self,
+        rl_player,
+        player_configuration: Optional[PlayerConfiguration] = None,
+        *,
+        avatar: Optional[int] = None,
+        battle_format: str = "gen8randombattle",
+        log_level: Optional[int] = None,
+        max_concurrent_battles: int = 1,
+        server_configuration: Optional[ServerConfiguration] = None,
+        start_listening: bool = True,
+        inference_batcher: Optional[InferenceBatcher] = None,
+        enable_timer: bool = False,
+    ) -> None:
+        """
+        :param rl_player: The RLPlayer whose model, embedding and action space we play with.
+        :type rl_player: RLPlayer
+        :param player_configuration: Player configuration. If empty, defaults to an
+            automatically generated username with no password. This option must be set
+            if the server configuration requires authentication.
+        :type player_configuration: PlayerConfiguration, optional
+        :param avatar: Player avatar id. Optional.
+        :type avatar: int, optional
+        :param battle_format: Name of the battle format this player plays. Defaults to
+            gen8randombattle.
+        :type battle_format: str
+        :param log_level: The player's logger level.
+        :type log_level: int. Defaults to logging's default level.
+        :param max_concurrent_battles: Maximum number of battles this player will play
+            concurrently. If 0, no limit will be applied. Defaults to 1.
+        :type max_concurrent_battles: int
+        :param server_configuration: Server configuration. Defaults to Localhost Server
+            Configuration.
+        :type server_configuration: ServerConfiguration, optional
+        :param start_listening: Wheter to start listening to the server. Defaults to
+            True.
+        :type start_listening: bool
+        :param inference_batcher: Batches the Q-value computations of concurrent battles.
+            If empty, every decision calls the model on its own.
+        :type inference_batcher: InferenceBatcher, optional
+        :param enable_timer: Whether to turn the battle timer on at the start of every battle,
+            so that human opponents cannot stall our other battles. Defaults to False.
+        :type enable_timer: bool
+        """
+        super(ModelPlayer, self).__init__(
+            player_configuration=player_configuration,
+            avatar=avatar,
+            battle_format=battle_format,
+            log_level=log_level,
+            max_concurrent_battles=max_concurrent_battles,
+            server_configuration=server_configuration,
+            start_listening=start_listening,
+        )
+
+        self._rl_player = rl_player
+        self._inference_batcher = inference_batcher
+        self._enable_timer = enable_timer
+        # The model looks at the last MEMORY_WINDOW observations of each battle
+        self._recent_observations = {}
+        self.enable_battle_counters(config.get_win_rate_window())
+        self.set_battle_retention(config.get_finished_battles_kept(), config.get_finished_battle_max_age())
+        self.enable_outbound_queue(config.build_outbound_rate_limiter(self._server_url), config.get_chat_reserve())
+
+    def choose_move(self, battle : Battle) -> str:
+        state = self._get_recent_state(battle)
+        q_values = self._rl_player.dqn.compute_q_values(state)
+        return self._choose_action(q_values, battle)
+
+    def _choose_action(self, q_values : np.ndarray, battle : Battle) -> str:
+        # Only pick from the actions that are legal this turn
+        action_mask = self._rl_player._legal_action_mask(battle)
+        action = int(np.argmax(np.where(action_mask, q_values, -np.inf)))
+        return self._rl_player._action_to_move(action, battle)
+
+    async def _handle_battle_request(self, battle : Battle, from_teampreview_request : bool = False, maybe_default_order : bool = False):
+        if self._inference_batcher is None or maybe_default_order or battle.teampreview:
+            await super(ModelPlayer, self)._handle_battle_request(battle, from_teampreview_request, maybe_default_order)
+            return
+
+        # Wait for the batch without blocking the event loop, so that the other battles can queue their decisions too
+        state = self._get_recent_state(battle)
+        q_values = await self._inference_batcher.compute_async(state)
+        await self._send_message(self._choose_action(q_values, battle), battle.battle_tag)
+
+    def _get_recent_state(self, battle : Battle) -> List[np.ndarray]:
+        observation = self._rl_player.embed_battle(battle)
+
+        window = self._recent_observations.get(battle.battle_tag)
+        if window is None:
+            window = deque(maxlen=config.MEMORY_WINDOW)
+            self._recent_observations[battle.battle_tag] = window
+        window.append(observation)
+
+        # Pad the start of the battle with empty observations, like keras-rl's memory does
+        state = list(window)
+        while len(state) < config.MEMORY_WINDOW:
+            state.insert(0, np.zeros_like(observation))
+        return state
+
+    async def _battle_started_callback(self, battle : Battle) -> None:
+        if self._enable_timer:
+            self._queue_chat("/timer on", battle.battle_tag)
+
+    async def _battle_finished_callback(self, battle : Battle) -> None:
+        self._recent_observations.pop(battle.battle_tag, None)
+        self._rl_player._forget_taken_actions(battle)
+        await super(ModelPlayer, self)._battle_finished_callback(battle)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import asyncio
+
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Tuple
+
+if TYPE_CHECKING:
+    from poke_env.player.player import Player
+
+class OpponentRegistry():
+    """
+    Builds opponents the first time they are asked for, instead of when the config is imported.
+    Every opponent opens its own connection to Showdown, so opponents that go unused for more than
+    max_idle_cycles whole training cycles are logged out and rebuilt if they are needed again.
+    The Cycle opponent uses each of them once every len(factories) cycles, so the limit is never shorter than that.
+    A max_idle_cycles of 0 keeps every opponent connected.
+    """
+    def __init__(self, factories : Dict[str, Callable[[], "Player"]], max_idle_cycles : int = 0):
+        self._factories = factories
+        self._max_idle_cycles = max(max_idle_cycles, len(factories)) if max_idle_cycles > 0 else 0
+        self._players = {}
+        self._last_used_cycle = {}
+        self._cycle = 0
+
+    def __len__(self) -> int:
+        return len(self._factories)
+
+    def __contains__(self, name : str) -> bool:
+        return name in self._factories
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._factories)
+
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def get(self, name : str) -> "Player":
+        player = self._players.get(name)
+        if player is None:
+            player = self._factories[name]()
+            self._players[name] = player
+        self._last_used_cycle[name] = self._cycle
+        return player
+
+    def items(self) -> Iterable[Tuple[str, "Player"]]:
+        for name in self._factories:
+            yield name, self.get(name)
+
+    def values(self) -> Iterable["Player"]:
+        for _, player in self.items():
+            yield player
+
+    def is_connected(self, name : str) -> bool:
+        return name in self._players
+
+    def connected(self) -> List[str]:
+        return list(self._players)
+
+    def advance_cycle(self) -> None:
+        self._cycle += 1
+        self.close_idle()
+
+    def close_idle(self) -> None:
+        if self._max_idle_cycles <= 0:
+            return
+        for name in list(self._players):
+            if self._cycle - self._last_used_cycle[name] > self._max_idle_cycles:
+                self.close(name)
+
+    def close(self, name : str) -> None:
+        player = self._players.pop(name, None)
+        if player is None:
+            return
+
+        loop = asyncio.get_event_loop()
+        if loop.is_running():
+            asyncio.ensure_future(player.stop_listening())
+        else:
+            loop.run_until_complete(player.stop_listening())
+
+    def close_all(self) -> None:
+        for name in list(self._players):
+            self.close(name)
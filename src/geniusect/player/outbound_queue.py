@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import asyncio
+import time
+
+from collections import OrderedDict
+
+from typing import Optional
+
+# Showdown asks users to use a paste service when they send more lines than this at once
+MAX_LINES_PER_MESSAGE = 3
+
+class RateLimiter():
+    """
+    Token bucket: up to burst messages can go out at once, and after that one every 1 / messages_per_second seconds.
+    """
+    def __init__(self, messages_per_second : float, burst : int):
+        self._rate = messages_per_second
+        self._burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+
+    def take(self, reserve : int = 0) -> float:
+        """
+        Takes a token if one is free beyond the reserve tokens, and returns 0.
+        Otherwise returns how many seconds until one will be.
+        """
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._last_refill) * self._rate, self._burst)
+        self._last_refill = now
+        if self._tokens >= reserve + 1:
+            self._tokens -= 1
+            return 0.0
+        return (reserve + 1 - self._tokens) / self._rate
+
+class OutboundQueueMixin():
+    """
+    Sends chat and cosmetic commands (greetings, timers, lobby status) from a queue of their own,
+    so that they never hold up battle decisions.
+    _queue_chat returns straight away; queued lines to the same room go out together, a few to a message.
+    With a RateLimiter, everything sent counts towards the server's rate limit, but chat only goes out
+    while reserve messages could still be sent at once, so decisions never wait behind it.
+    Mix in ahead of the poke-env player class.
+    """
+    _rate_limiter = None
+    _chat_reserve = 0
+
+    def enable_outbound_queue(self, rate_limiter : Optional[RateLimiter], reserve : int = 0) -> None:
+        self._rate_limiter = rate_limiter
+        self._chat_reserve = reserve
+        # Lines waiting to be sent, by room
+        self._pending_chat = OrderedDict()
+        self._chat_task = None
+
+    async def _send_message(self, message : str, room : str = "", message_2 : Optional[str] = None) -> None:
+        if self._rate_limiter is not None:
+            wait = self._rate_limiter.take()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._rate_limiter.take()
+        await super(OutboundQueueMixin, self)._send_message(message, room, message_2)
+
+    def _queue_chat(self, message : str, room : str = "") -> None:
+        """
+        Sends message to room once nothing more important needs sending. Must be called from the event loop.
+        """
+        if not hasattr(self, "_pending_chat"):
+            # No queue; send it the usual way
+            asyncio.ensure_future(self._send_message(message, room))
+            return
+
+        self._pending_chat.setdefault(room, []).append(message)
+        if self._chat_task is None:
+            self._chat_task = asyncio.ensure_future(self._send_chat())
+
+    async def _send_chat(self) -> None:
+        try:
+            while len(self._pending_chat) > 0:
+                if self._rate_limiter is not None:
+                    wait = self._rate_limiter.take(self._chat_reserve)
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                        continue
+                room, lines = next(iter(self._pending_chat.items()))
+                if len(lines) > MAX_LINES_PER_MESSAGE:
+                    self._pending_chat[room] = lines[MAX_LINES_PER_MESSAGE:]
+                    self._pending_chat.move_to_end(room)
+                else:
+                    del self._pending_chat[room]
+                await super(OutboundQueueMixin, self)._send_message("\n".join(lines[:MAX_LINES_PER_MESSAGE]), room)
+        except Exception as e:
+            print("Unable to send chat: " + str(e))
+            self._pending_chat.clear()
+        finally:
+            self._chat_task = None
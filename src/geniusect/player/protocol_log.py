@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import gzip
+import json
+import os
+
+from poke_env.environment.battle import Battle
+from poke_env.exceptions import UnexpectedEffectException
+
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from src.geniusect.player.reinforcement_learning_player import RLPlayer
+
+PROTOCOL_LOG_EXTENSION = ".jsonl.gz"
+
+class ProtocolLogMixin():
+    """
+    Keeps the raw Showdown messages of every battle a player plays, along with the actions it took,
+    and writes each battle to a gzipped JSON-lines file of its own once the battle is over.
+    Replaying a log rebuilds the battle exactly, so it can be embedded again after embed_battle changes.
+    Mix in ahead of the poke-env player class.
+    """
+    _protocol_log_dir = None
+
+    def enable_protocol_log(self, directory : str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        # Events of each battle in progress, by battle tag
+        self._protocol_logs = {}
+        self._protocol_log_dir = directory
+
+    async def _handle_battle_message(self, message : str) -> None:
+        if self._protocol_log_dir is not None:
+            battle_tag = message.split("\n", 1)[0][1:].strip()
+            self._protocol_logs.setdefault(battle_tag, []).append({"m": message})
+        await super(ProtocolLogMixin, self)._handle_battle_message(message)
+
+    def _log_protocol_action(self, battle : Battle, action : int) -> None:
+        if self._protocol_log_dir is None:
+            return
+        events = self._protocol_logs.get(battle.battle_tag)
+        if events is not None:
+            events.append({"a": int(action)})
+
+    async def _battle_finished_callback(self, battle : Battle) -> None:
+        self._write_protocol_log(battle)
+        await super(ProtocolLogMixin, self)._battle_finished_callback(battle)
+
+    def _write_protocol_log(self, battle : Battle) -> None:
+        if self._protocol_log_dir is None:
+            return
+        events = self._protocol_logs.pop(battle.battle_tag, None)
+        if events is None:
+            return
+
+        header = {
+            "battle_tag": battle.battle_tag,
+            "username": self.username,
+            "battle_format": self.format,
+            "won": battle.won
+        }
+        path = os.path.join(self._protocol_log_dir, battle.battle_tag + PROTOCOL_LOG_EXTENSION)
+        # Written under another name first, so a reader never sees half a log
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as log_file:
+            log_file.write(json.dumps(header) + "\n")
+            for event in events:
+                log_file.write(json.dumps(event) + "\n")
+        os.replace(path + ".tmp", path)
+
+def read_protocol_log(path : str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    The header and events of a protocol log.
+    Each event is either a raw battle message ("m") or the action we took at that point ("a").
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as log_file:
+        header = json.loads(log_file.readline())
+        events = [json.loads(line) for line in log_file if line.strip() != ""]
+    return header, events
+
+def apply_battle_message(battle : Battle, message : str) -> None:
+    """
+    Updates battle with one raw battle message, the way Player._handle_battle_message does,
+    minus everything that talks back to the server.
+    """
+    # The first line names the battle
+    for split_message in [line.split("|") for line in message.split("\n")][1:]:
+        if len(split_message) <= 1 or split_message[1] in ("", "init"):
+            continue
+
+        kind = split_message[1]
+        if kind == "request":
+            if split_message[2]:
+                request = json.loads(split_message[2])
+                if request:
+                    battle._parse_request(request)
+        elif kind == "title":
+            player_1, player_2 = split_message[2].split(" vs. ")
+            battle.players = player_1, player_2
+        elif kind == "win":
+            battle._won_by(split_message[2])
+        elif kind == "tie":
+            battle._tied()
+        elif kind == "turn":
+            battle.turn = int(split_message[2])
+        elif kind in ("error", "expire", "teampreview"):
+            pass
+        else:
+            try:
+                battle._parse_message(split_message)
+            except UnexpectedEffectException:
+                pass
+
+def replay_protocol_log(path : str, rl_player : "RLPlayer") -> List[list]:
+    """
+    Rebuilds the steps of a logged battle with rl_player's current embedding and rewards.
+    Returns a list of (observation, action, reward, done, action mask, battle tag) steps,
+    the same layout as a TrajectoryRecorder episode.
+    """
+    header, events = read_protocol_log(path)
+    battle = Battle(header["battle_tag"], header["username"], rl_player.logger)
+
+    steps = []
+    for event in events:
+        if "m" in event:
+            apply_battle_message(battle, event["m"])
+            continue
+
+        # The reward of the previous action is only known once the next decision comes around
+        if len(steps) > 0:
+            steps[-1][2] = rl_player.compute_reward(battle)
+        observation = rl_player.embed_battle(battle)
+        action_mask = rl_player._legal_action_mask(battle)
+        # Goes through the same code as the live battle did, so the action history matches
+        rl_player._action_to_move(event["a"], battle)
+        steps.append([observation, event["a"], 0.0, False, action_mask, battle.battle_tag])
+
+    if len(steps) > 0:
+        steps[-1][2] = rl_player.compute_reward(battle)
+        steps[-1][3] = battle.finished
+    rl_player._forget_taken_actions(battle)
+    return steps
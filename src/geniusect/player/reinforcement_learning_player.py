@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import asyncio
 import math
 import os
 import threading
@@ -16,7 +17,7 @@ from rl.callbacks import Callback
 
 from typing import Any, Callable, List, Optional, Tuple, Union, Set
 
-from poke_env.data import ABILITYDEX, ITEMS, to_id_str
+from poke_env.data import ABILITYDEX, to_id_str
 from poke_env.environment.battle import Battle
 from poke_env.environment.effect import Effect
 from poke_env.environment.field import Field
@@ -32,7 +33,19 @@ from poke_env.server_configuration import ServerConfiguration
 from poke_env.teambuilder.teambuilder import Teambuilder
 from poke_env.environment.weather import Weather
 
+from src.geniusect.damage_calculator import get_damage_calculator
+from src.geniusect.data_bundle import get_data_bundle
+from src.geniusect.evaluation.evaluation_ledger import EvaluationLedger
+from src.geniusect.local_server.local_showdown_server import get_local_server, is_local_server, start_player
 from src.geniusect.neural_net.dqn_history import DQNHistory
+from src.geniusect.neural_net.trajectory_recorder import TrajectoryRecorder
+from src.geniusect.player.action_history import ActionHistory
+from src.geniusect.player.battle_counters import BattleCountersMixin
+from src.geniusect.player.battle_retention import BattleRetentionMixin
+from src.geniusect.player.model_player import ModelPlayer
+from src.geniusect.player.outbound_queue import OutboundQueueMixin
+from src.geniusect.player.protocol_log import ProtocolLogMixin
+from src.geniusect.showdown_pool import ShowdownServerPool
 
 AVAILABLE_STATS = ["atk", "def", "spa", "spd", "spe", "evasion", "accuracy"]
 NUM_MOVES = 4
@@ -47,7 +60,7 @@ tf.random.set_seed(0)
 np.random.seed(0)
 os.system('color')
 
-class RLPlayer(Gen8EnvSinglePlayer, Callback):
+class RLPlayer(BattleCountersMixin, BattleRetentionMixin, OutboundQueueMixin, ProtocolLogMixin, Gen8EnvSinglePlayer, Callback):
     def __init__(
         self,
         train = True,
@@ -61,6 +74,7 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         server_configuration: Optional[ServerConfiguration] = None,
         start_listening: bool = True,
         team: Optional[Union[str, Teambuilder]] = None,
+        server_pool: Optional[ShowdownServerPool] = None,
     ):
         """
         :param player_configuration: Player configuration. If empty, defaults to an
@@ -84,21 +98,37 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
             team string, a showdown packed team string, of a ShowdownTeam object.
             Defaults to None.
         :type team: str or Teambuilder, optional
+        :param server_pool: Pool of local Showdown servers to spread evaluation battles over.
+            If empty, every battle is played on server_configuration.
+        :type server_pool: ShowdownServerPool, optional
         """
+        # The in-process stand-in server connects players itself
+        on_local_simulator = is_local_server(server_configuration)
+
         super(RLPlayer, self).__init__(
             player_configuration=player_configuration,
             avatar=avatar,
             battle_format=battle_format,
             log_level=log_level,
             server_configuration=server_configuration,
-            start_listening=start_listening,
+            start_listening=start_listening and not on_local_simulator,
             team=team,
         )
 
+        if start_listening and on_local_simulator:
+            get_local_server(server_configuration).connect(self)
+
+        self._server_configuration = server_configuration
+        self._server_pool = server_pool
+        self._data_bundle = get_data_bundle()
+
         input_layer_size = self._get_layer_size()
         output_layer_size = len(self.action_space)
         self.model = config.build_model(input_layer_size, output_layer_size)
         self.dqn = config.build_dqn(self.model, output_layer_size)
+        self._inference_batcher = config.build_inference_batcher(self.dqn)
+        self.dqn.action_mask_fn = lambda: self._legal_action_mask(getattr(self, "_current_battle", None))
+        self.dqn.battle_tag_fn = lambda: self._current_battle.battle_tag
 
         self.train = train
         self.use_checkpoint = load_from_checkpoint
@@ -106,6 +136,12 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         self._validate_untrained = False
 
         self._history = DQNHistory()
+        self._render_sink = config.build_render_sink()
+        self._trajectory_recorder = None
+        if config.get_record_trajectories():
+            self._trajectory_recorder = TrajectoryRecorder(config.get_trajectory_dir(self.format), output_layer_size,
+                                                           shard_mb=config.get_trajectory_shard_mb(),
+                                                           max_queued_episodes=config.get_trajectory_queue_episodes())
         self._last_reward = None
         self._batch_count = 0
         self._num_steps_taken = 0
@@ -113,13 +149,20 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         self._timer = None
         self._last_step_start_time = time.time()
         # Only join lobbies on localhost
-        self._on_local_server = "localhost" in self._server_url
+        self._on_local_server = "localhost" in self._server_url or on_local_simulator
         self._done_joining_lobby = False
         self._rating = 1000
         self._best_batch_num = None
         self._best_mae = None
 
-        self._taken_actions = np.negative(np.ones(MOVE_MEMORY))
+        # ActionHistory of each battle, so that concurrent battles keep separate histories.
+        # Kept by Battle rather than by tag: the ModelPlayers sharing this dict play on several servers, which all number battles from 1
+        self._taken_actions = {}
+        if config.get_record_protocol_logs():
+            self.enable_protocol_log(config.get_protocol_log_dir(self.format))
+        self.enable_battle_counters(config.get_win_rate_window())
+        self.set_battle_retention(config.get_finished_battles_kept(), config.get_finished_battle_max_age())
+        self.enable_outbound_queue(config.build_outbound_rate_limiter(self._server_url), config.get_chat_reserve())
         self._current_opponent = ""
 
         if self.train:
@@ -127,20 +170,20 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
 
     async def _battle_started_callback(self, battle : Battle) -> None:
         if self._on_local_server and not self._done_joining_lobby:
-            await self._send_message("/join lobby")
+            self._queue_chat("/join lobby")
             self._done_joining_lobby = True
 
         self.logger.info("New battle started: " + battle.battle_tag)
 
         if not self._on_local_server:
-            await self._send_message("/timer on", battle.battle_tag)
-            await self._send_message("Hi, I'm a \"Deep Q\" learning bot named Geniusect! I'm still learning how to play, so I'll do silly things a lot. I won't be able to reply, although you might see " + config.get_human_username() +  " spectate.", battle.battle_tag)
+            self._queue_chat("/timer on", battle.battle_tag)
+            self._queue_chat("Hi, I'm a \"Deep Q\" learning bot named Geniusect! I'm still learning how to play, so I'll do silly things a lot. I won't be able to reply, although you might see " + config.get_human_username() +  " spectate.", battle.battle_tag)
 
     async def _battle_finished_callback(self, battle : Battle) -> None:
         await super(RLPlayer, self)._battle_finished_callback(battle)
 
         # Forget all moves we've done as they are no longer relevant
-        self._taken_actions = np.negative(np.ones(MOVE_MEMORY))
+        self._forget_taken_actions(battle)
         rating = battle.rating
         if rating is None:
             self._rating = 1000
@@ -151,44 +194,91 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
 
         if self._on_local_server and self._done_joining_lobby:
             if self._last_reward is not None:
-                await self._send_message("Last reward: " + str(self._last_reward), "lobby")
+                self._queue_chat("Last reward: " + str(self._last_reward), "lobby")
                 
-            await self._send_message("Turn %4d. | [%s][%3d/%3dhp] %10.10s - %10.10s [%3d%%hp][%s]"
-            % (
-                battle.turn,
-                "".join(
-                    [
-                        "⦻" if mon.fainted else " ● "
-                        for mon in battle.team.values()
-                    ]
-                ),
-                battle.active_pokemon.current_hp or 0,
-                battle.active_pokemon.max_hp or 0,
-                battle.active_pokemon.species,
-                battle.opponent_active_pokemon.species,  # pyre-ignore
-                battle.opponent_active_pokemon.current_hp  # pyre-ignore
-                or 0,
-                "".join(
-                    [
-                        "⦻" if mon.fainted else " ● "
-                        for mon in battle.opponent_team.values()
-                    ]
-                ),
-            ),
-            "lobby")
+            self._queue_chat(self._render_line(battle), "lobby")
         else:
-            self.render()
-            print("")
-            time.sleep(10)
+            if self._render_sink is not None:
+                self._render_sink.offer(lambda: self._render_line(battle), force=True)
 
-    def _action_to_move(self, action: int, battle: Battle) -> str:
-        # Place oldest action at the front of the list (rotating/shifting the list by 1)
-        # e.g. 4,3,2,1 -> 1,4,3,2
-        self._taken_actions = np.roll(self._taken_actions, 1)
+    def _render_line(self, battle : Battle) -> str:
+        """
+        A one line rendering of the state of the battle.
+        """
+        return "Turn %4d. | [%s][%3d/%3dhp] %10.10s - %10.10s [%3d%%hp][%s]" % (
+            battle.turn,
+            "".join(
+                [
+                    "⦻" if mon.fainted else " ● "
+                    for mon in battle.team.values()
+                ]
+            ),
+            battle.active_pokemon.current_hp or 0,
+            battle.active_pokemon.max_hp or 0,
+            battle.active_pokemon.species,
+            battle.opponent_active_pokemon.species,  # pyre-ignore
+            battle.opponent_active_pokemon.current_hp  # pyre-ignore
+            or 0,
+            "".join(
+                [
+                    "⦻" if mon.fainted else " ● "
+                    for mon in battle.opponent_team.values()
+                ]
+            ),
+        )
+
+    def _get_taken_actions(self, battle : Battle) -> ActionHistory:
+        taken_actions = self._taken_actions.get(battle)
+        if taken_actions is None:
+            taken_actions = ActionHistory(MOVE_MEMORY)
+            self._taken_actions[battle] = taken_actions
+        return taken_actions
+
+    def _forget_taken_actions(self, battle : Battle) -> None:
+        self._taken_actions.pop(battle, None)
+
+    def _final_reward(self, battle : Battle) -> Optional[float]:
+        return self._reward_buffer.get(battle)
+
+    def _forget_battle(self, battle : Battle) -> None:
+        # The environment keeps its queues and rewards by Battle, and never lets go of them either
+        if battle is getattr(self, "_current_battle", None):
+            return
+        self._observations.pop(battle, None)
+        self._actions.pop(battle, None)
+        self._reward_buffer.pop(battle, None)
+
+    def _legal_action_mask(self, battle : Battle) -> np.ndarray:
+        """
+        Which of the actions in the action space _action_to_move would actually play this turn.
+        Anything else falls back to a random move, so it's hidden from the agent.
+        """
+        mask = np.zeros(len(self._ACTION_SPACE), dtype=bool)
+        if battle is None:
+            mask[:] = True
+            return mask
+
+        # Moves (0-3), Z-moves (4-7), mega evolving (8-11), dynamaxing (12-15), then switches (16-21)
+        n_moves = 0 if battle.force_switch else min(len(battle.available_moves), 4)
+        mask[0:n_moves] = True
+        if n_moves > 0 and battle.can_z_move and battle.active_pokemon is not None:
+            mask[4:4 + min(len(battle.active_pokemon.available_z_moves), 4)] = True
+        if battle.can_mega_evolve:
+            mask[8:8 + n_moves] = True
+        if battle.can_dynamax:
+            mask[12:12 + n_moves] = True
+        mask[16:16 + min(len(battle.available_switches), 6)] = True
 
-        # Place most recent taken action at index 0
-        # e.g. 5,4,3,2
-        self._taken_actions[0] = action / len(self._ACTION_SPACE)
+        if not mask.any():
+            # Nothing we can pick; let _action_to_move fall back on its default
+            mask[:] = True
+        return mask
+
+    def _action_to_move(self, action: int, battle: Battle) -> str:
+        # The most recent action goes at the front of the history, pushing the oldest one out
+        # e.g. 4,3,2,1 -> 5,4,3,2
+        self._get_taken_actions(battle).push(action / len(self._ACTION_SPACE))
+        self._log_protocol_action(battle, action)
 
         move_name = super(RLPlayer, self)._action_to_move(action, battle)
         self.logger.info(self.username + " is taking action " + move_name)
@@ -275,6 +365,19 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
 
         active_move_observations = self._gather_move_observations(battle.available_moves[:NUM_MOVES], battle.opponent_active_pokemon)
 
+        # Expected damage of each available move against the opponent, as a fraction of their HP
+        # -1 indicates that the move is not available
+        moves_expected_damage = -np.ones(NUM_MOVES)
+        if len(battle.available_moves) > 0 and battle.opponent_active_pokemon is not None:
+            expected_damage = get_damage_calculator().expected_damage(
+                battle.active_pokemon,
+                battle.available_moves[:NUM_MOVES],
+                [battle.opponent_active_pokemon],
+                weather=battle.weather,
+                defender_side_conditions=battle.opponent_side_conditions
+            )[:, 0]
+            moves_expected_damage[:len(expected_damage)] = np.minimum(expected_damage, 1.0)
+
         our_pokemon_observations = []
         for mon in battle.team.values():
             pokemon_observations = self._gather_pokemon_observations(mon, battle.opponent_active_pokemon)
@@ -297,7 +400,7 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         final_vector = np.concatenate(
             [
                 [battle_turn],
-                self._taken_actions,
+                self._get_taken_actions(battle).view(),
                 [our_side_conditions, opponent_side_conditions],
                 [weather, field_id],
                 [our_dynamax_turns_left, opponent_dynamax_turns_left, our_dynamax_status, opponent_dynamax_status],
@@ -306,6 +409,7 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
                 opponent_effects,
                 [remaining_mon_team, remaining_mon_opponent],
                 active_move_observations,
+                moves_expected_damage,
                 our_pokemon_observations,
                 opponent_pokemon_observations
             ]
@@ -353,10 +457,11 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         for i in range(len(pkm_possible_abilities)):
             possible_abilities[i] = ABILITYDEX[to_id_str(pkm_possible_abilities[i])] / len(ABILITYDEX)
 
-        try:
-            item = ITEMS[to_id_str(pkm.item)]["num"] / len(ITEMS)
-        except (AttributeError, KeyError, TypeError):
-            item = -1
+        item = -1
+        if pkm.item:
+            item_id = self._data_bundle.item_id(pkm.item)
+            if item_id >= 0:
+                item = self._data_bundle.item_num[item_id] / len(self._data_bundle.items)
 
         moves = self._gather_move_observations(list(pkm.moves.values())[:NUM_MOVES], opponent_pkm)
 
@@ -496,9 +601,9 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         )
 
     def on_step_begin(self, step, logs):
-        if not self._on_local_server:
-            self.render()
-            print("")
+        if self._render_sink is not None and not self._on_local_server:
+            battle = self._current_battle
+            self._render_sink.offer(lambda: self._render_line(battle))
 
         self._last_step_start_time = time.time()
 
@@ -523,6 +628,7 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         """ Render environment at the end of each action """
         self._history.history.setdefault("rating", []).append(self._rating)
         self._history.history.setdefault("win_rate", []).append(self.win_rate)
+        self._history.history.setdefault("rolling_win_rate", []).append(self.rolling_win_rate)
 
         self._last_reward = logs["episode_reward"]
         try:
@@ -536,8 +642,12 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         checkpoint_dir = config.get_checkpoint_dir(self.format)
         return os.path.join(checkpoint_dir, "geniusect.ckpt")
 
+    def _get_evaluation_ledger(self) -> EvaluationLedger:
+        checkpoint_dir = config.get_checkpoint_dir(self.format)
+        return EvaluationLedger(os.path.join(checkpoint_dir, "evaluation_ledger.jsonl"))
+
     def _get_layer_size(self) -> int:
-        return 1469
+        return 1473
 
     # This is the function that will be used to train the dqn
     def _dqn_training(self, player, dqn, nb_steps):
@@ -555,8 +665,11 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         tb_callback = tf.keras.callbacks.TensorBoard(log_dir=config.get_tensorboard_log_dir(self.format),
                                                         write_graph=False, 
                                                         histogram_freq=100)
+        callbacks = [self, tb_callback, cp_callback, early_callback, self._history]
+        if self._trajectory_recorder is not None:
+            callbacks.append(self._trajectory_recorder)
         try:
-            dqn.fit(player, nb_steps=nb_steps, callbacks=[self, tb_callback, cp_callback, early_callback, self._history])
+            dqn.fit(player, nb_steps=nb_steps, callbacks=callbacks)
         except Exception as e:
             print("Exception during training: " + str(e))
             self._dqn_training(player, dqn, nb_steps - self._num_steps_taken)
@@ -574,20 +687,12 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
 
         cached_opponent = self._current_opponent
 
-        if self.use_checkpoint:
-            print("Trying to load from checkpoint")
-            checkpoint_dir = config.get_checkpoint_dir(self.format)
-            try:
-                latest = tf.train.latest_checkpoint(checkpoint_dir)
-                self.model.load_weights(latest)
-            
-                if self.validate:
-                    # Run tests of loaded model
-                    print("Evaluating loaded model" + CBLUE)
-                    self._evaluate_dqn()
-                    print(CEND)
-            except (AttributeError, ValueError):
-                print("Unable to load checkpoint")
+        if self.use_checkpoint and self._load_checkpoint():
+            if self.validate:
+                # Run tests of loaded model
+                print("Evaluating loaded model" + CBLUE)
+                self._evaluate_dqn()
+                print(CEND)
 
         self._current_opponent = cached_opponent
 
@@ -608,8 +713,9 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
             self.dqn.trainable_model.stop_training = False
             
             try:
+                self._close_opponents_on_restarted_servers()
                 if self._current_opponent != "ladder":
-                    opponent = config.get_opponent(battle_format=self.format, cycle_count=cycle_count)
+                    opponent = config.get_opponent(battle_format=self.format, cycle_count=cycle_count, server_configuration=self._server_configuration)
                     self._current_opponent = opponent.username
                 else:
                     opponent = None
@@ -626,8 +732,9 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
                 else:
                     nb_steps -= self._num_steps_taken
                 cycle_count += 1
+                config.advance_opponent_cycle()
 
-                if cycle_count % len(config.opponents) == 0:
+                if config.get_learning_rate_decay() and cycle_count % len(config.opponents) == 0:
                     if old_lr > 0.00000001:
                         new_lr = old_lr * 0.1
                         K.set_value(self.dqn.trainable_model.optimizer.lr, new_lr)
@@ -642,6 +749,8 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         train_end_time = time.time() - train_start_time
 
         print("Training complete in " + str(train_end_time) + " seconds. win rate: " + str(self.win_rate * 100.0) + "%")
+        for opponent_name, counts in self.battle_counters.by_opponent.items():
+            print("  %s: %d/%d won, %.1f%% over the last %d" % (opponent_name, counts.won, counts.finished, counts.rolling.win_rate * 100.0, counts.rolling.count))
         self._current_opponent = ""
 
         if self.validate:
@@ -649,6 +758,54 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
             self._evaluate_dqn()
             print(CEND)
 
+    def _load_checkpoint(self) -> bool:
+        print("Trying to load from checkpoint")
+        checkpoint_dir = config.get_checkpoint_dir(self.format)
+        try:
+            latest = tf.train.latest_checkpoint(checkpoint_dir)
+            self.model.load_weights(latest)
+            return True
+        except (AttributeError, ValueError):
+            print("Unable to load checkpoint")
+            return False
+
+    def play_ladder(self, n_games : int, player_configuration : PlayerConfiguration, server_configuration : Optional[ServerConfiguration] = None, avatar : Optional[int] = None) -> None:
+        """
+        Plays n_games ladder games with the current model, without training on them.
+        Up to LadderConcurrentBattles games are in flight at once, all served by this player's model.
+        The games are played under player_configuration, so this player should not be listening itself.
+        """
+        if self.use_checkpoint:
+            self._load_checkpoint()
+
+        if server_configuration is None:
+            server_configuration = self._server_configuration
+
+        ladder_player = start_player(ModelPlayer,
+            server_configuration,
+            rl_player=self,
+            player_configuration=player_configuration,
+            avatar=avatar,
+            battle_format=self.format,
+            log_level=self.logger.level,
+            max_concurrent_battles=config.get_ladder_concurrent_battles(),
+            inference_batcher=self._inference_batcher,
+            enable_timer=True)
+
+        loop = asyncio.get_event_loop()
+        ladder_start_time = time.time()
+        loop.run_until_complete(ladder_player.ladder(n_games))
+        ladder_end_time = time.time() - ladder_start_time
+        loop.run_until_complete(ladder_player.stop_listening())
+
+        if self._inference_batcher is not None:
+            self._inference_batcher.stop()
+
+        print(
+            "Ladder: %d victories out of %d games in %d seconds (%.1f games per hour)"
+            % (ladder_player.n_won_battles, ladder_player.n_finished_battles, ladder_end_time, ladder_player.n_finished_battles * 3600 / max(ladder_end_time, 1))
+        )
+
     def _start_battle_internal(self, opponent, nb_steps):
         try:
             self.play_against(
@@ -666,12 +823,66 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
         dqn.test(player, nb_episodes=nb_episodes, visualize=True, verbose=True)
 
     def _evaluate_dqn(self) -> None:
-        nb_episodes = config.get_num_evaluation_episodes()
+        ledger = self._get_evaluation_ledger()
+        weights_hash = EvaluationLedger.hash_weights(self.model)
+        settings = config.get_evaluation_settings()
 
+        # Skip any opponent these exact weights have already been evaluated against
         wins = []
+        pending_opponents = []
+        for opponent_id in config.opponents.names():
+            cached_result = ledger.get(weights_hash, opponent_id, self.format, settings)
+            if cached_result is None:
+                pending_opponents.append(opponent_id)
+            else:
+                print(
+                    "DQN Evaluation: %d victories out of %d episodes against %s (cached)"
+                    % (cached_result["won"], cached_result["played"], opponent_id)
+                )
+                wins.append((opponent_id, cached_result["won"], cached_result["lost"]))
+
+        if len(pending_opponents) == 0:
+            print(wins)
+            print("\n")
+            return wins
+
+        # Evaluation plays every baseline; the ones training isn't using are closed again afterwards
+        self._close_opponents_on_restarted_servers()
+        connected_opponents = config.get_connected_opponents()
+        try:
+            if config.get_parallel_evaluation():
+                results = self._evaluate_dqn_parallel(pending_opponents)
+            else:
+                results = self._evaluate_dqn_sequential(pending_opponents)
+        finally:
+            config.close_opponents_connected_since(connected_opponents)
+
+        for opponent_id, n_won, n_lost, n_played in results:
+            ledger.record(weights_hash, opponent_id, self.format, n_won, n_lost, n_played, settings)
+            wins.append((opponent_id, n_won, n_lost))
+
+        print(wins)
+        print("\n")
+        return wins
+
+    def _close_opponents_on_restarted_servers(self) -> None:
+        # Opponents on a server the pool restarted are still holding the old, dead connection
+        if self._server_pool is None:
+            return
+
+        for server_configuration in self._server_pool.take_restarted():
+            config.close_opponents_on(server_configuration)
+            if server_configuration.server_url == self._server_configuration.server_url:
+                print("The Showdown server we train on was restarted; training has to be restarted to reconnect to it")
+
+    def _evaluate_dqn_sequential(self, opponents) -> None:
+        nb_episodes = config.get_num_evaluation_episodes()
+
+        results = []
 
         # Evaluation
-        for opponent in config.opponents.values():
+        for opponent_id in opponents:
+            opponent = config.get_opponents(self._server_configuration).get(opponent_id)
             evaluate_start_time = time.time()
             self._current_opponent = opponent.username
             print("Results against " + self._current_opponent + ":")
@@ -682,7 +893,7 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
                 env_algorithm_kwargs={"dqn": self.dqn, "nb_episodes": nb_episodes},
             )
 
-            wins.append((self._current_opponent, self.n_won_battles, self.n_lost_battles))
+            results.append((opponent_id, self.n_won_battles, self.n_lost_battles, self.n_finished_battles))
 
             evaluate_end_time = time.time() - evaluate_start_time
 
@@ -692,13 +903,76 @@ class RLPlayer(Gen8EnvSinglePlayer, Callback):
             )
 
             time.sleep(3)
-        print(wins)
-        print("\n")
 
         time.sleep(5)
 
         self._current_opponent = ""
-        return wins
+        return results
+
+    def _evaluate_dqn_parallel(self, opponents) -> None:
+        nb_episodes = config.get_num_evaluation_episodes() + 1
+        concurrent_battles = config.get_evaluation_concurrent_battles()
+
+        evaluate_start_time = time.time()
+
+        # One model player per opponent, so that every opponent keeps its own win/loss record
+        # Each pair goes on the least busy server of the pool, if we have one
+        model_players = []
+        for opponent_id in opponents:
+            if self._server_pool is not None:
+                server_configuration = self._server_pool.acquire()
+            else:
+                server_configuration = self._server_configuration
+
+            opponent = config.get_opponents(server_configuration).get(opponent_id)
+            model_player = start_player(ModelPlayer,
+                server_configuration,
+                rl_player=self,
+                battle_format=self.format,
+                log_level=self.logger.level,
+                max_concurrent_battles=concurrent_battles,
+                inference_batcher=self._inference_batcher)
+            model_players.append((model_player, opponent_id, opponent, server_configuration))
+
+        loop = asyncio.get_event_loop()
+        results = loop.run_until_complete(asyncio.gather(
+            *[self._evaluate_against(model_player, opponent_id, opponent, nb_episodes, concurrent_battles) for model_player, opponent_id, opponent, _ in model_players]
+        ))
+
+        for model_player, _, _, server_configuration in model_players:
+            loop.run_until_complete(model_player.stop_listening())
+            if self._server_pool is not None:
+                self._server_pool.release(server_configuration)
+
+        if self._inference_batcher is not None:
+            self._inference_batcher.stop()
+            print("Average inference batch size: %.2f" % self._inference_batcher.mean_batch_size)
+
+        evaluate_end_time = time.time() - evaluate_start_time
+        print("Parallel evaluation took %d seconds" % evaluate_end_time)
+
+        return results
+
+    async def _evaluate_against(self, model_player : ModelPlayer, opponent_id : str, opponent, nb_episodes : int, concurrent_battles : int):
+        stop_rule = config.build_evaluation_stop_rule()
+        evaluate_start_time = time.time()
+
+        # Play in rounds of concurrent battles, checking after each round whether the win rate is settled
+        while model_player.n_finished_battles < nb_episodes:
+            if stop_rule.should_stop(model_player.n_won_battles, model_player.n_finished_battles):
+                break
+
+            n_battles = min(concurrent_battles, nb_episodes - model_player.n_finished_battles)
+            await model_player.battle_against(opponent, n_battles=n_battles)
+
+        evaluate_end_time = time.time() - evaluate_start_time
+
+        print(
+            "DQN Evaluation: %d victories out of %d episodes against %s; took %d seconds"
+            % (model_player.n_won_battles, model_player.n_finished_battles, opponent_id, evaluate_end_time)
+        )
+
+        return (opponent_id, model_player.n_won_battles, model_player.n_lost_battles, model_player.n_finished_battles)
 
     def _side_condition_id(self, side_conditions : Set[SideCondition]) -> float:
         output = 0.0
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+from typing import Callable, Optional
+
+class RenderSink():
+    """
+    Writes battle renders from a thread of its own, so the decision loop never waits on the console or disk.
+    Only every every_n_steps-th offer, or the first offer after every_seconds seconds, is rendered at all.
+    Lines go to log_path, rotated once it is max_bytes long, or to stdout when there is no log_path.
+    """
+    def __init__(self, every_n_steps : int = 0, every_seconds : float = 0.0, log_path : Optional[str] = None,
+                 max_bytes : int = 10 * 1024 * 1024, backup_count : int = 3, max_queued_lines : int = 1000):
+        self._every_n_steps = every_n_steps
+        self._every_seconds = every_seconds
+        self._n_offers = 0
+        self._last_render_time = 0.0
+        self.n_dropped = 0
+
+        self._logger = None
+        if log_path is not None:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._logger = logging.getLogger("geniusect.render." + str(id(self)))
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(handler)
+
+        self._lines = queue.Queue(max_queued_lines)
+        self._thread = threading.Thread(target=self._write_lines, name="RenderSink", daemon=True)
+        self._thread.start()
+
+    def offer(self, render : Callable[[], str], force : bool = False) -> None:
+        """
+        Calls render and writes the line it returns, if this offer is sampled or force is set.
+        """
+        self._n_offers += 1
+        now = time.time()
+        sampled = (self._every_n_steps > 0 and self._n_offers % self._every_n_steps == 0) or \
+                  (self._every_seconds > 0 and now - self._last_render_time >= self._every_seconds)
+        if not sampled and not force:
+            return
+
+        self._last_render_time = now
+        try:
+            self._lines.put_nowait(render())
+        except queue.Full:
+            # The writer can't keep up; better to lose a render than to wait on it
+            self.n_dropped += 1
+
+    def close(self) -> None:
+        self._lines.put(None)
+        self._thread.join()
+        if self._logger is not None:
+            for handler in list(self._logger.handlers):
+                handler.close()
+                self._logger.removeHandler(handler)
+
+    def _write_lines(self) -> None:
+        while True:
+            line = self._lines.get()
+            if line is None:
+                return
+            if self._logger is not None:
+                self._logger.info(line)
+            else:
+                print(line, flush=True)
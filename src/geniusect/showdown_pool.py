@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import socket
+import subprocess
+import threading
+import time
+
+from poke_env.server_configuration import ServerConfiguration
+
+from typing import List
+
+AUTHENTICATION_URL = "https://play.pokemonshowdown.com/action.php?"
+
+class ShowdownServer():
+    def __init__(self, port : int, showdown_path : str):
+        self.port = port
+        self.showdown_path = showdown_path
+        self.process = None
+        self.failed_health_checks = 0
+        self.restarts = 0
+        self.assigned = 0
+
+    @property
+    def server_configuration(self) -> ServerConfiguration:
+        return ServerConfiguration("localhost:" + str(self.port), AUTHENTICATION_URL)
+
+    def start(self) -> None:
+        print("Starting local Showdown server on port " + str(self.port))
+        self.process = subprocess.Popen(
+            ["node", self.showdown_path, str(self.port)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.STDOUT
+        )
+        self.failed_health_checks = 0
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.process = None
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def is_accepting_connections(self) -> bool:
+        try:
+            with socket.create_connection(("localhost", self.port), timeout=1.0):
+                return True
+        except OSError:
+            return False
+
+class ShowdownServerPool():
+    """
+    Runs several local Showdown servers on consecutive ports.
+    Showdown is single-threaded, so spreading battles over one server per core
+    lets the simulator keep up with many concurrent battles.
+    A monitor thread health-checks every server and restarts any that crash or hang.
+    Only evaluation battles are spread over the pool. Training plays on the one server main.py acquires,
+    and the training player is not reconnected if that server is restarted.
+    """
+    def __init__(self, num_servers : int, base_port : int = 8000, showdown_path : str = "Pokemon-Showdown/pokemon-showdown", health_check_interval : float = 5.0, max_failed_health_checks : int = 3):
+        self._servers = [ShowdownServer(base_port + i, showdown_path) for i in range(num_servers)]
+        self._health_check_interval = health_check_interval
+        self._max_failed_health_checks = max_failed_health_checks
+        self._lock = threading.Lock()
+        # Servers restarted since take_restarted was last called
+        self._restarted = []
+        self._stop_event = threading.Event()
+        self._monitor_thread = None
+
+    def __len__(self) -> int:
+        return len(self._servers)
+
+    def start(self, timeout : float = 60.0) -> None:
+        try:
+            for server in self._servers:
+                server.start()
+        except FileNotFoundError:
+            print("Unable to start local Showdown servers: node was not found")
+            return
+
+        self.wait_until_ready(timeout)
+
+        self._stop_event.clear()
+        self._monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+        self._monitor_thread.start()
+
+    def wait_until_ready(self, timeout : float = 60.0) -> bool:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if all(server.is_accepting_connections() for server in self._servers):
+                return True
+            time.sleep(0.5)
+
+        print("Not every Showdown server came up within " + str(timeout) + " seconds")
+        return False
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
+            self._monitor_thread = None
+
+        for server in self._servers:
+            server.stop()
+
+    def _monitor(self) -> None:
+        while not self._stop_event.wait(self._health_check_interval):
+            for server in self._servers:
+                self._check_server(server)
+
+    def _check_server(self, server : ShowdownServer) -> None:
+        if not server.is_running():
+            print("Showdown server on port " + str(server.port) + " crashed; restarting it")
+            self._restart(server)
+            return
+
+        if server.is_accepting_connections():
+            server.failed_health_checks = 0
+            return
+
+        server.failed_health_checks += 1
+        if server.failed_health_checks >= self._max_failed_health_checks:
+            print("Showdown server on port " + str(server.port) + " stopped responding; restarting it")
+            self._restart(server)
+
+    def _restart(self, server : ShowdownServer) -> None:
+        # acquire looks at which servers are running, so it has to wait until the restart is done
+        with self._lock:
+            server.stop()
+            server.restarts += 1
+            self._restarted.append(server.server_configuration)
+            try:
+                server.start()
+            except FileNotFoundError:
+                pass
+
+    def take_restarted(self) -> List[ServerConfiguration]:
+        """
+        Returns the servers restarted since the last call. Anything connected to them before is on a dead connection.
+        """
+        with self._lock:
+            restarted = self._restarted
+            self._restarted = []
+            return restarted
+
+    def acquire(self) -> ServerConfiguration:
+        """
+        Returns the server with the fewest player/opponent pairs on it.
+        Both players of a pair have to be given the same server.
+        """
+        with self._lock:
+            candidates = [server for server in self._servers if server.is_running()]
+            if len(candidates) == 0:
+                candidates = self._servers
+
+            server = min(candidates, key=lambda server: server.assigned)
+            server.assigned += 1
+            return server.server_configuration
+
+    def release(self, server_configuration : ServerConfiguration) -> None:
+        with self._lock:
+            for server in self._servers:
+                if server.server_configuration.server_url == server_configuration.server_url:
+                    server.assigned = max(server.assigned - 1, 0)
+                    return
+
+    @property
+    def server_configurations(self) -> List[ServerConfiguration]:
+        return [server.server_configuration for server in self._servers]
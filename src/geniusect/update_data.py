@@ -3,6 +3,8 @@
 import os
 import logging
 
+import src.geniusect.data_bundle as data_bundle
+
 def update_pokedex():
 	print("Updating Pokedex")
 	import src.updaters.pokedex_update_script
@@ -53,4 +55,19 @@ def update_learnset():
 		pass
 	os.rename("out.json", LEARNSET_DATA_LOCATION)
 
-	print("Learnset updated")
\ No newline at end of file
+	print("Learnset updated")
+
+def compile_data_bundle():
+	# Packs the JSON files above into one memory-mapped file, so that processes don't parse the JSON themselves
+	print("Compiling data bundle")
+	if data_bundle.compile_bundle():
+		print("Data bundle compiled to " + data_bundle.BUNDLE_PATH)
+	else:
+		print("Data bundle already up to date")
+
+if __name__ == "__main__":
+	update_pokedex()
+	update_itemdex()
+	update_movedex()
+	update_learnset()
+	compile_data_bundle()
\ No newline at end of file
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Hyperparameter sweep over ai_variables.cfg with asynchronous successive halving.
+# Every trial is a separate main.py run with a config of its own (passed through GENIUSECT_AI_CONFIG),
+# its own Showdown ports and its own checkpoint directory. After each rung the trial is scored by its
+# mean win rate against the baselines, from its evaluation ledger, and only the best trials train further:
+#   python sweep.py --trials 27 --parallel 4 --min-steps 10000 --max-steps 270000
+#   python sweep.py --space my_space.json --name lr-only
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import time
+
+from tabulate import tabulate
+
+import src.geniusect.config as config
+
+from src.geniusect.evaluation.successive_halving import AshaScheduler, Trial
+from src.geniusect.evaluation.trial_process import sample_params, score_trial, start_trial, write_trial_config
+
+# "Section.Option": how to sample it
+# log_uniform and uniform take "low" and "high"; choice takes "values"
+DEFAULT_SPACE = {
+    "Train.LearningRate": {"type": "log_uniform", "low": 0.00001, "high": 0.1},
+    "Train.DropoutKeepInputLayer": {"type": "uniform", "low": 0.5, "high": 1.0},
+    "Train.DropoutKeepHiddenLayer": {"type": "uniform", "low": 0.3, "high": 1.0},
+    "DQN.Gamma": {"type": "uniform", "low": 0.9, "high": 0.999},
+    "DQN.DeltaClip": {"type": "uniform", "low": 0.5, "high": 5.0},
+    "Rewards.FaintedReward": {"type": "uniform", "low": 0.5, "high": 5.0},
+    "Rewards.HPReward": {"type": "uniform", "low": 1.0, "high": 30.0},
+    "Rewards.StatusReward": {"type": "uniform", "low": 0.0, "high": 10.0},
+    "Rewards.VictoryReward": {"type": "uniform", "low": 0.5, "high": 30.0},
+}
+
+SWEEP_DIR = os.path.join("data", "sweeps")
+
+def trial_dir(sweep_name : str, trial : Trial) -> str:
+    return os.path.join(SWEEP_DIR, sweep_name, "trial-" + str(trial.trial_id).zfill(3))
+
+def start_job(base_config_path : str, sweep_name : str, scheduler : AshaScheduler, trial : Trial, rung : int, worker : int) -> subprocess.Popen:
+    # Later rungs pick up from the checkpoint of the rung before, so only the extra steps are trained
+    steps = scheduler.budgets[rung] - (scheduler.budgets[rung - 1] if rung > 0 else 0)
+    directory = trial_dir(sweep_name, trial)
+    config_path = write_trial_config(base_config_path, directory, trial.params, steps, worker)
+    print("Trial %d: training to %d steps on worker %d" % (trial.trial_id, scheduler.budgets[rung], worker))
+    return start_trial(directory, config_path, "rung-" + str(rung) + ".log")
+
+def print_results(scheduler : AshaScheduler, space : dict) -> None:
+    names = list(space.keys())
+    rows = []
+    for trial in scheduler.leaderboard():
+        rows.append([trial.trial_id, trial.rung, scheduler.budgets[trial.rung] if trial.rung >= 0 else 0,
+                     "%.3f" % trial.score if trial.score is not None else "-"] +
+                    ["%.4g" % trial.params[name] if isinstance(trial.params[name], float) else trial.params[name] for name in names])
+    print(tabulate(rows, headers=["Trial", "Rung", "Steps", "Win Rate"] + names))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep with asynchronous successive halving")
+    parser.add_argument("--name", default=time.strftime("%Y%m%d-%H%M%S"))
+    parser.add_argument("--space", default=None, help="JSON file of the hyperparameters to sweep; see DEFAULT_SPACE")
+    parser.add_argument("--trials", type=int, default=27)
+    parser.add_argument("--parallel", type=int, default=4, help="Trials training at once")
+    parser.add_argument("--min-steps", type=int, default=10000, help="Training steps of the first rung")
+    parser.add_argument("--max-steps", type=int, default=270000, help="Training steps of the last rung")
+    parser.add_argument("--eta", type=int, default=3, help="Only the top 1/eta of each rung is promoted")
+    parser.add_argument("--format", default="gen8randombattle")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    base_config_path = os.environ.get(config.AI_CONFIG_ENV, "ai_variables.cfg")
+    if config.get_train_against_ladder():
+        raise SystemExit("Trials are scored against the baselines, so they can't train against the ladder")
+
+    space = DEFAULT_SPACE
+    if args.space is not None:
+        with open(args.space, "r") as space_file:
+            space = json.load(space_file)
+
+    rng = random.Random(args.seed)
+    scheduler = AshaScheduler(args.trials, args.min_steps, args.max_steps, eta=args.eta)
+    results_path = os.path.join(SWEEP_DIR, args.name, "results.jsonl")
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    print("Sweeping %d trials, %d at a time, over rungs of %s steps" % (args.trials, args.parallel, scheduler.budgets))
+
+    # Running jobs, by worker
+    jobs = {}
+    try:
+        while not scheduler.is_finished():
+            for worker in range(args.parallel):
+                if worker in jobs:
+                    continue
+                job = scheduler.next_job(lambda: sample_params(space, rng))
+                if job is None:
+                    break
+                trial, rung = job
+                jobs[worker] = (trial, rung, start_job(base_config_path, args.name, scheduler, trial, rung, worker))
+
+            time.sleep(5)
+            for worker, (trial, rung, process) in list(jobs.items()):
+                if process.poll() is None:
+                    continue
+                process.log_file.close()
+                del jobs[worker]
+
+                score = score_trial(trial_dir(args.name, trial), args.format) if process.returncode == 0 else 0.0
+                scheduler.report(trial, rung, score)
+                print("Trial %d: win rate %.3f after %d steps%s" % (trial.trial_id, score, scheduler.budgets[rung],
+                      "" if process.returncode == 0 else " (exited with " + str(process.returncode) + ")"))
+                with open(results_path, "a") as results_file:
+                    results_file.write(json.dumps({"trial": trial.trial_id, "rung": rung, "steps": scheduler.budgets[rung],
+                                                   "win_rate": score, "returncode": process.returncode, "params": trial.params}) + "\n")
+    except KeyboardInterrupt:
+        print("\nStopping the sweep")
+        for trial, rung, process in jobs.values():
+            process.terminate()
+            process.wait()
+            process.log_file.close()
+
+    print_results(scheduler, space)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+# Trains the Q-network on trajectories recorded with RecordTrajectories, without a Showdown server.
+# The model and agent are built from ai_variables.cfg the same way as for online training, and the
+# weights are saved where RLPlayer loads its checkpoints from, so online training can pick up from here:
+#   python train_offline.py --epochs 5
+#   python train_offline.py --updates 100000 --resume
+
+import argparse
+import os
+import time
+
+import src.geniusect.config as config
+
+from src.geniusect.neural_net.trajectory_dataset import TrajectoryDataset
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train on recorded trajectories")
+    parser.add_argument("--format", default="gen8randombattle")
+    parser.add_argument("--trajectories", default=None, help="Directory of recorded shards; defaults to the configured TrajectoryDir")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--updates", type=int, default=None, help="Stop after this many updates, even if epochs remain")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--shuffle-shards", type=int, default=4, help="Shards loaded and shuffled together")
+    parser.add_argument("--prefetch", type=int, default=8, help="Minibatches prepared ahead of training")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--resume", action="store_true", help="Start from the latest checkpoint")
+    parser.add_argument("--log-interval", type=int, default=1000)
+    args = parser.parse_args()
+
+    trajectory_dir = args.trajectories if args.trajectories is not None else config.get_trajectory_dir(args.format)
+    dataset = TrajectoryDataset(trajectory_dir, config.MEMORY_WINDOW,
+        batch_size=args.batch_size,
+        shuffle_shards=args.shuffle_shards,
+        prefetch=args.prefetch,
+        seed=args.seed)
+    if dataset.n_shards == 0:
+        raise SystemExit("No recorded trajectories in " + trajectory_dir)
+    print("Training on " + str(dataset.n_steps) + " steps from " + str(dataset.n_shards) + " shards")
+
+    import tensorflow as tf
+
+    input_layer_size, output_layer_size = dataset.shapes()
+    model = config.build_model(input_layer_size, output_layer_size)
+    dqn = config.build_dqn(model, output_layer_size)
+    dqn.batch_size = args.batch_size
+
+    checkpoint_dir = config.get_checkpoint_dir(args.format)
+    if args.resume:
+        latest = tf.train.latest_checkpoint(checkpoint_dir)
+        if latest is None:
+            print("No checkpoint to resume from; starting from scratch")
+        else:
+            dqn.load_weights(latest)
+
+    start_time = time.time()
+    dqn.fit_offline(dataset.batches(args.epochs), nb_updates=args.updates, log_interval=args.log_interval)
+    print("Offline training complete in " + str(time.time() - start_time) + " seconds")
+
+    dqn.save_weights(os.path.join(checkpoint_dir, "geniusect.ckpt"), overwrite=True)
+    print("Weights saved to " + checkpoint_dir)